@@ -0,0 +1,50 @@
+# src/bench_heading.py
+# Micro-benchmark for heading detection: per-block is_heading vs the vectorized heading_scores.
+# Usage: python src/bench_heading.py [pdf_dir] [--runs N]
+import argparse
+import os
+import sys
+import time
+from pdf_utils import load_pdf, extract_text_blocks, calculate_document_stats, is_heading, to_columns, heading_scores
+
+def per_block_mask(blocks, stats):
+    mask = []
+    prev_block = None
+    for block in blocks:
+        mask.append(is_heading(block, stats, prev_block))
+        prev_block = block
+    return mask
+
+def vectorized_mask(blocks, stats):
+    return (heading_scores(to_columns(blocks), stats) >= 4).tolist()
+
+def best_time(fn, runs):
+    best = float('inf')
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('pdf_dir', nargs='?', default='input/')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    mismatched = False
+    for filename in sorted(f for f in os.listdir(args.pdf_dir) if f.endswith('.pdf')):
+        doc = load_pdf(os.path.join(args.pdf_dir, filename))
+        blocks = extract_text_blocks(doc)
+        doc.close()
+        stats = calculate_document_stats(blocks)
+        slow, slow_mask = best_time(lambda: per_block_mask(blocks, stats), args.runs)
+        fast, fast_mask = best_time(lambda: vectorized_mask(blocks, stats), args.runs)
+        same = slow_mask == fast_mask
+        mismatched = mismatched or not same
+        print(f"{filename}: {len(blocks)} blocks, per-block {slow * 1000:.1f}ms, "
+              f"vectorized {fast * 1000:.1f}ms ({slow / fast:.1f}x), identical: {same}")
+    sys.exit(1 if mismatched else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+# src/bench_rerank.py
+# Reranker backend benchmark: pairs/second for each backend plus a parity check of its score ordering
+# against the fp32 torch reference (Spearman correlation and top-k overlap).
+# Usage: python src/bench_rerank.py [pdf_dir] [--backends torch,torch-int8,onnx] [--pairs 200]
+import argparse
+import os
+import sys
+import time
+import numpy as np
+from parse_cache import parse_pdf
+from persona_intelligence import build_query, local_model_path, rerank_batching, RERANK_THREADS
+from rerankers import get_reranker
+
+def load_pairs(pdf_dir, query, limit):
+    texts = []
+    for filename in sorted(f for f in os.listdir(pdf_dir) if f.endswith('.pdf')):
+        _, _, sections = parse_pdf(os.path.join(pdf_dir, filename))
+        texts.extend(s['refined_text'][:500] for s in sections if len(s['refined_text'].split()) >= 20)
+    return [[query, t] for t in texts[:limit]]
+
+def spearman(a, b):
+    rank_a = np.argsort(np.argsort(a))
+    rank_b = np.argsort(np.argsort(b))
+    return float(np.corrcoef(rank_a, rank_b)[0, 1])
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('pdf_dir', nargs='?', default='input/')
+    parser.add_argument('--backends', default='torch,torch-int8,onnx')
+    parser.add_argument('--pairs', type=int, default=200)
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--min-spearman', type=float, default=0.95)
+    parser.add_argument('--min-overlap', type=float, default=0.8, help='fraction of the reference top-k kept')
+    args = parser.parse_args()
+
+    query = build_query("Analyze revenue trends, R&D investments, and market positioning strategies", "Investment Analyst")
+    pairs = load_pairs(args.pdf_dir, query, args.pairs)
+    if not pairs:
+        print(f"No sections with 20+ words found in {args.pdf_dir}")
+        sys.exit(1)
+    batching = rerank_batching()
+    print(f"{len(pairs)} pairs, {RERANK_THREADS} threads, batching {batching}")
+
+    reference = None
+    failed = False
+    for name in args.backends.split(','):
+        try:
+            backend = get_reranker(name, local_model_path, RERANK_THREADS, **batching)
+        except Exception as e:
+            print(f"{name}: unavailable ({e})")
+            continue
+        backend.predict_logits(pairs[:1])  # Warm-up
+        start = time.perf_counter()
+        logits = backend.predict_logits(pairs)
+        elapsed = time.perf_counter() - start
+        line = f"{name}: {len(pairs) / elapsed:.1f} pairs/s"
+        if reference is None:
+            reference = logits
+            line += " (reference)"
+        else:
+            rho = spearman(reference, logits)
+            k = min(args.top_k, len(pairs))
+            overlap = len(set(np.argsort(-reference)[:k]) & set(np.argsort(-logits)[:k])) / k
+            line += f", spearman {rho:.3f}, top-{k} overlap {overlap:.0%}"
+            if rho < args.min_spearman or overlap < args.min_overlap:
+                line += " PARITY FAIL"
+                failed = True
+        print(line)
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+# src/bench_startup.py
+# Startup-time benchmark: times a cold import of each pipeline in a fresh interpreter and checks
+# that none of them pulls in the reranker stack before it is needed.
+# Usage: python src/bench_startup.py [--runs N] [--max-seconds S]
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+HEAVY_MODULES = ['torch', 'transformers', 'nltk']
+TARGETS = {
+    'outline': 'import extract_outline',
+    '1b': 'import persona_intelligence',
+}
+
+PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+{stmt}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+'''
+
+def time_import(stmt):
+    code = PROBE.format(stmt=stmt, heavy=HEAVY_MODULES)
+    out = subprocess.run([sys.executable, '-c', code], cwd=SRC_DIR, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--max-seconds', type=float, default=None, help='fail if a median import exceeds this')
+    args = parser.parse_args()
+
+    failed = False
+    for name, stmt in TARGETS.items():
+        runs = [time_import(stmt) for _ in range(args.runs)]
+        median = statistics.median(r['seconds'] for r in runs)
+        heavy = runs[-1]['heavy']
+        print(f"{name}: median import {median:.3f}s over {args.runs} runs, heavy modules loaded: {heavy or 'none'}")
+        if heavy:
+            failed = True
+        if args.max_seconds is not None and median > args.max_seconds:
+            print(f"{name}: exceeds {args.max_seconds:.3f}s")
+            failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+# src/benchmark_1b.py
+# Benchmark suite for the 1B pipeline over every samples/1b/* collection and test case.
+# Each collection runs in a fresh interpreter with the parse and rerank caches off, and records wall time,
+# CPU time and peak RSS for every stage (load, blocks, outline, sections, bm25, rerank, json). Collections
+# with a challenge1b_output.json also get precision/recall/F1/NDCG from evaluate_1b.
+# Usage: python src/benchmark_1b.py [--samples samples/1b] [--report output/benchmark_1b.json]
+#                                   [--baseline old_report.json] [--tolerance 0.02] [--use-cache]
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+STAGES = ['load', 'blocks', 'outline', 'sections', 'bm25', 'rerank', 'json']
+QUALITY_METRICS = ['precision', 'recall', 'f1', 'ndcg']
+
+# Persona/job for sample test cases that ship PDFs without a config (a config.json in the folder wins)
+TEST_CASE_QUERIES = {
+    'TestCase 1': ('PhD Researcher in Computational Biology',
+                   'Prepare a comprehensive literature review focusing on methodologies, datasets, and performance benchmarks'),
+    'TestCase 2': ('Investment Analyst', 'Analyze revenue trends, R&D investments, and market positioning strategies'),
+    'TestCase3': ('Undergraduate Chemistry Student',
+                  'Identify key concepts and mechanisms for exam preparation on reaction kinetics'),
+}
+
+class StageTimer:
+    def __init__(self):
+        self.stages = {name: {'wall_s': 0.0, 'cpu_s': 0.0, 'peak_rss_mb': 0.0} for name in STAGES}
+
+    @contextmanager
+    def __call__(self, name):
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            stage = self.stages[name]
+            stage['wall_s'] += time.perf_counter() - wall
+            stage['cpu_s'] += time.process_time() - cpu
+            # ru_maxrss is the process high-water mark (KiB on Linux), so this is the peak up to this stage
+            stage['peak_rss_mb'] = max(stage['peak_rss_mb'], resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024)
+
+def find_collections(samples_dir):
+    collections = []
+    for name in sorted(os.listdir(samples_dir)):
+        path = os.path.join(samples_dir, name)
+        if not os.path.isdir(path):
+            continue
+        config = None
+        for config_name in ('config.json', 'challenge1b_input.json'):
+            if os.path.exists(os.path.join(path, config_name)):
+                with open(os.path.join(path, config_name), 'r', encoding='utf-8') as f:
+                    config = json.load(f)
+                break
+        pdf_dir = os.path.join(path, 'PDFs') if os.path.isdir(os.path.join(path, 'PDFs')) else path
+        if config is None and name in TEST_CASE_QUERIES:
+            role, task = TEST_CASE_QUERIES[name]
+            config = {
+                'challenge_info': {'challenge_id': name.replace(' ', '_')},
+                'documents': [{'filename': f} for f in sorted(os.listdir(pdf_dir)) if f.endswith('.pdf')],
+                'persona': {'role': role},
+                'job_to_be_done': {'task': task}
+            }
+        if config is None:
+            continue
+        ground_truth = os.path.join(path, 'challenge1b_output.json')
+        collections.append({'name': name, 'config': config, 'pdf_dir': pdf_dir,
+                            'ground_truth': ground_truth if os.path.exists(ground_truth) else None})
+    return collections
+
+def run_stages(collection, output_dir):
+    # Runs in the child process; mirrors run_collection stage by stage
+    from pdf_utils import load_pdf, extract_text_blocks, calculate_document_stats, build_outline, extract_section_text
+    from persona_intelligence import (build_query, select_candidates, cascade_rerank, combine_scores, build_output,
+                                      write_collection_output)
+    config = collection['config']
+    timer = StageTimer()
+    results = []
+    for d in config['documents']:
+        with timer('load'):
+            doc = load_pdf(os.path.join(collection['pdf_dir'], d['filename']))
+        with timer('blocks'):
+            blocks = extract_text_blocks(doc)
+        with timer('outline'):
+            outline = build_outline(blocks, calculate_document_stats(blocks))
+        with timer('sections'):
+            sections = extract_section_text(doc, outline, blocks)
+        doc.close()
+        for section in sections:
+            section['doc'] = d['filename']
+        results.append(sections)
+
+    query = build_query(config['job_to_be_done']['task'], config['persona']['role'])
+    texts = [s['refined_text'][:500] for sections in results for s in sections]
+    with timer('bm25'):
+        candidates = select_candidates(texts, query)
+    with timer('rerank'):
+        rerank_scores = cascade_rerank(query, [texts[i] for i in candidates])
+    flat_scores = combine_scores(texts, candidates, rerank_scores)
+    doc_scores = []
+    offset = 0
+    for sections in results:
+        doc_scores.append(flat_scores[offset:offset + len(sections)])
+        offset += len(sections)
+    with timer('json'):
+        output_data = build_output(config, results, doc_scores)
+        output_filename = write_collection_output(output_data, config, output_dir)
+    return {'stages': timer.stages, 'sections': len(texts), 'ranked': len(output_data['extracted_sections']),
+            'output': output_filename}
+
+def quality(output_filename, ground_truth):
+    from evaluate_1b import load_json, compute_precision_recall_f1, compute_ndcg
+    ours = load_json(output_filename).get('extracted_sections', [])
+    truth = load_json(ground_truth).get('extracted_sections', [])
+    precision, recall, f1 = compute_precision_recall_f1(ours, truth)
+    try:
+        ndcg = float(compute_ndcg(ours, truth))
+    except ValueError:  # ndcg_score needs at least two common titles
+        ndcg = 0.0
+    return {'precision': precision, 'recall': recall, 'f1': f1, 'ndcg': ndcg}
+
+def run_child(collection, output_dir, use_cache):
+    env = dict(os.environ)
+    env['OUTPUT_FORMAT'] = 'pretty'  # evaluate_1b reads the output as a single JSON document
+    if not use_cache:
+        env['PDF_CACHE_DIR'] = ''
+        env['RERANK_CACHE_PATH'] = ''
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--child', json.dumps(collection), '--output-dir', output_dir],
+        capture_output=True, text=True, env=env
+    )
+    if proc.returncode != 0:
+        return {'error': proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit {proc.returncode}"}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+def compare(report, baseline, tolerance):
+    # Prints wall-time and quality deltas against a stored report; returns False on a quality regression
+    ok = True
+    for name, current in report['collections'].items():
+        previous = baseline.get('collections', {}).get(name)
+        if not previous or 'error' in current or 'error' in previous:
+            continue
+        now = sum(s['wall_s'] for s in current['stages'].values())
+        before = sum(s['wall_s'] for s in previous['stages'].values())
+        line = f"{name}: wall {before:.2f}s -> {now:.2f}s ({(now - before) / before:+.0%})" if before else f"{name}:"
+        for metric in QUALITY_METRICS:
+            if current.get('metrics') and previous.get('metrics'):
+                delta = current['metrics'][metric] - previous['metrics'][metric]
+                line += f", {metric} {delta:+.3f}"
+                if delta < -tolerance:
+                    line += " REGRESSION"
+                    ok = False
+        print(line)
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--samples', default='samples/1b')
+    parser.add_argument('--report', default='output/benchmark_1b.json')
+    parser.add_argument('--output-dir', default='output/benchmark_1b')
+    parser.add_argument('--baseline', default=None, help='earlier report to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.02, help='allowed drop in any quality metric')
+    parser.add_argument('--use-cache', action='store_true', help='keep parse and rerank caches on')
+    parser.add_argument('--child', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_stages(json.loads(args.child), args.output_dir)))
+        return
+
+    report = {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'collections': {}}
+    for collection in find_collections(args.samples):
+        missing = [d['filename'] for d in collection['config']['documents']
+                   if not os.path.exists(os.path.join(collection['pdf_dir'], d['filename']))]
+        if missing:
+            report['collections'][collection['name']] = {'error': f"missing {len(missing)} PDFs"}
+            print(f"{collection['name']}: skipped, missing {len(missing)} PDFs")
+            continue
+        result = run_child(collection, args.output_dir, args.use_cache)
+        if 'error' not in result and collection['ground_truth']:
+            result['metrics'] = quality(result['output'], collection['ground_truth'])
+        report['collections'][collection['name']] = result
+        if 'error' in result:
+            print(f"{collection['name']}: error {result['error']}")
+            continue
+        timings = ', '.join(f"{name} {s['wall_s']:.2f}s" for name, s in result['stages'].items())
+        print(f"{collection['name']}: {timings}; peak RSS {result['stages']['json']['peak_rss_mb']:.0f} MB")
+        if result.get('metrics'):
+            print('    ' + ', '.join(f"{m} {result['metrics'][m]:.2f}" for m in QUALITY_METRICS))
+
+    os.makedirs(os.path.dirname(args.report) or '.', exist_ok=True)
+    with open(args.report, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=4)
+    print(f"Report saved to {args.report}")
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if not compare(report, baseline, args.tolerance):
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
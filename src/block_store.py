@@ -0,0 +1,115 @@
+import os
+from collections import namedtuple
+import numpy as np
+
+TextBlock = namedtuple('TextBlock', ['text', 'font_size', 'flags', 'bbox', 'page'])
+
+class BlockStore:
+    # Struct-of-arrays block list: float32 font_size (n,) and bbox (n, 4), int32 flags and page, and every
+    # text in one UTF-8 buffer addressed by offsets. Indexing and iteration yield TextBlock tuples, so code
+    # written against lists keeps working; slices and page ranges are views over the same arrays.
+    # MuPDF coordinates and sizes are single precision, so float32 round-trips them exactly.
+    FIELDS = ('font_size', 'flags', 'bbox', 'page', 'text', 'offsets')
+
+    def __init__(self, font_size, flags, bbox, page, text, offsets):
+        self.font_size = font_size
+        self.flags = flags
+        self.bbox = bbox
+        self.page = page
+        self.text = text  # uint8 buffer
+        self.offsets = offsets  # len(self) + 1 byte offsets into text, not necessarily starting at 0
+
+    @classmethod
+    def from_blocks(cls, blocks):
+        if isinstance(blocks, BlockStore):
+            return blocks
+        blocks = list(blocks)
+        encoded = [b.text.encode('utf-8') for b in blocks]
+        offsets = np.zeros(len(blocks) + 1, dtype=np.int64)
+        if encoded:
+            offsets[1:] = np.cumsum([len(e) for e in encoded])
+        return cls(
+            font_size=np.array([b.font_size for b in blocks], dtype=np.float32),
+            flags=np.array([b.flags for b in blocks], dtype=np.int32),
+            bbox=np.array([b.bbox for b in blocks], dtype=np.float32).reshape(-1, 4),
+            page=np.array([b.page for b in blocks], dtype=np.int32),
+            text=np.frombuffer(b''.join(encoded), dtype=np.uint8),
+            offsets=offsets
+        )
+
+    @classmethod
+    def concat(cls, stores):
+        stores = [cls.from_blocks(s) for s in stores]
+        if not stores:
+            return cls.from_blocks([])
+        texts = [s.text[s.offsets[0]:s.offsets[-1]] for s in stores]
+        sizes = np.cumsum([0] + [len(t) for t in texts])
+        offsets = [np.zeros(1, dtype=np.int64)] + [s.offsets[1:] - s.offsets[0] + base for s, base in zip(stores, sizes)]
+        return cls(
+            font_size=np.concatenate([s.font_size for s in stores]),
+            flags=np.concatenate([s.flags for s in stores]),
+            bbox=np.concatenate([s.bbox for s in stores]).reshape(-1, 4),
+            page=np.concatenate([s.page for s in stores]),
+            text=np.concatenate(texts),
+            offsets=np.concatenate(offsets)
+        )
+
+    def __len__(self):
+        return len(self.font_size)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                raise ValueError("BlockStore slices must be contiguous")
+            stop = max(start, stop)
+            return BlockStore(self.font_size[start:stop], self.flags[start:stop], self.bbox[start:stop],
+                              self.page[start:stop], self.text, self.offsets[start:stop + 1])
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("BlockStore index out of range")
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return TextBlock(
+            text=self.text[start:end].tobytes().decode('utf-8'),
+            font_size=float(self.font_size[index]),
+            flags=int(self.flags[index]),
+            bbox=tuple(self.bbox[index].tolist()),
+            page=int(self.page[index])
+        )
+
+    def __iter__(self):
+        # One bytes copy of the text buffer, then plain Python scalars for every block
+        texts = self.texts()
+        font_size, flags = self.font_size.tolist(), self.flags.tolist()
+        bbox, page = self.bbox.tolist(), self.page.tolist()
+        for i in range(len(self)):
+            yield TextBlock(texts[i], font_size[i], flags[i], tuple(bbox[i]), page[i])
+
+    def texts(self):
+        base = int(self.offsets[0])
+        buf = self.text[base:int(self.offsets[-1])].tobytes()
+        offsets = (self.offsets - base).tolist()
+        return [buf[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(len(self))]
+
+    def page_range(self, first, last):
+        # Blocks on pages first..last (1-based, inclusive) as a view; blocks are stored in page order
+        start, stop = np.searchsorted(self.page, [first, last + 1])
+        return self[int(start):int(stop)]
+
+    def compact(self):
+        # Copy of a view that owns only its own text, so pickling it ships just those bytes
+        return BlockStore.concat([self])
+
+    def arrays(self):
+        # Field name -> array for a store that owns exactly its own text; BlockStore(**arrays) rebuilds it
+        store = self.compact() if self.offsets[0] or self.offsets[-1] < len(self.text) else self
+        return {name: getattr(store, name) for name in self.FIELDS}
+
+    def save(self, directory):
+        for name, array in self.arrays().items():
+            np.save(os.path.join(directory, f'{name}.npy'), array)
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        return cls(**{name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mmap_mode) for name in cls.FIELDS})
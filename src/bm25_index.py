@@ -0,0 +1,57 @@
+from collections import Counter
+import numpy as np
+
+class BM25Index:
+    # Okapi BM25 over an inverted index of postings sorted by term, so queries only touch the
+    # postings of their own terms. k1, b and the IDF floor follow rank_bm25.BM25Okapi.
+    def __init__(self, tokenized_docs, k1=1.5, b=0.75, epsilon=0.25):
+        self.n_docs = len(tokenized_docs)
+        self.vocab = {}
+        term_ids, doc_ids, tfs = [], [], []
+        doc_len = np.zeros(self.n_docs, dtype=np.float64)
+        for d, tokens in enumerate(tokenized_docs):
+            doc_len[d] = len(tokens)
+            for term, tf in Counter(tokens).items():
+                term_ids.append(self.vocab.setdefault(term, len(self.vocab)))
+                doc_ids.append(d)
+                tfs.append(tf)
+        term_ids = np.array(term_ids, dtype=np.int64)
+        order = np.argsort(term_ids, kind='stable')
+        self.doc_ids = np.array(doc_ids, dtype=np.int64)[order]
+        tf = np.array(tfs, dtype=np.float64)[order]
+        df = np.bincount(term_ids, minlength=len(self.vocab))
+        self.indptr = np.concatenate([[0], np.cumsum(df)])
+
+        idf = np.log(self.n_docs - df + 0.5) - np.log(df + 0.5)
+        if len(idf):
+            idf[idf < 0] = epsilon * idf.mean()
+        self.idf = idf
+        avgdl = doc_len.mean() if self.n_docs and doc_len.sum() else 1.0
+        norm = k1 * (1 - b + b * doc_len[self.doc_ids] / avgdl)
+        # Per-posting BM25 contribution, precomputed once for the whole collection
+        self.weights = np.repeat(idf, df) * tf * (k1 + 1) / (tf + norm)
+
+    def get_scores_batch(self, queries_tokens):
+        # (len(queries_tokens), n_docs) scores as one sparse product: query term counts x the postings,
+        # which already are a CSR term-by-document weight matrix
+        from scipy.sparse import csr_matrix
+        rows, cols, counts = [], [], []
+        for q, query_tokens in enumerate(queries_tokens):
+            for term, count in Counter(query_tokens).items():
+                t = self.vocab.get(term)
+                if t is not None:
+                    rows.append(q)
+                    cols.append(t)
+                    counts.append(count)
+        queries = csr_matrix((np.array(counts, dtype=np.float64), (rows, cols)),
+                             shape=(len(queries_tokens), len(self.vocab)))
+        postings = csr_matrix((self.weights, self.doc_ids, self.indptr), shape=(len(self.vocab), self.n_docs))
+        return (queries @ postings).toarray()
+
+def top_indices(scores, k):
+    # Indices of the k highest scores, best first
+    if k < len(scores):
+        top = np.argpartition(-scores, k - 1)[:k]
+    else:
+        top = np.arange(len(scores))
+    return top[np.argsort(-scores[top], kind='stable')]
@@ -0,0 +1,172 @@
+# src/chunk_index.py
+# Embedding index over subsection_analysis sub-chunks. Chunks are embedded in batches with a sentence
+# embedding model (EMBED_MODEL_PATH, all-MiniLM-L6-v2 by default) and scored against the query with one
+# matrix product. Without the model (or sentence-transformers) hashed bag-of-words vectors are used instead.
+# Vectors are cached per text in memory and, unless EMBED_STORE_DIR is empty, in an on-disk .npy store.
+import hashlib
+import os
+import re
+import threading
+import time
+import zlib
+import numpy as np
+from tracing import traced
+
+EMBED_MODEL_PATH = os.environ.get('EMBED_MODEL_PATH', 'models/all-MiniLM-L6-v2')
+EMBED_BATCH_SIZE = int(os.environ.get('EMBED_BATCH_SIZE', 64))
+# Set EMBED_STORE_DIR to an empty string to keep vectors in memory only
+EMBED_STORE_DIR = os.environ.get('EMBED_STORE_DIR', '.cache/embeddings')
+EMBED_STORE_MAX_SHARDS = int(os.environ.get('EMBED_STORE_MAX_SHARDS', 16))
+HASH_DIM = 512
+
+class VectorStore:
+    # Text hash -> float32 vector. New vectors are appended to disk as (keys_<id>.npy, vectors_<id>.npy)
+    # shard pairs, which are memory-mapped on open and merged once there are more than max_shards
+    def __init__(self, model_id, path=None, max_shards=EMBED_STORE_MAX_SHARDS):
+        self.path = os.path.join(path, re.sub(r'[^\w.-]', '_', model_id)) if path else None
+        self.max_shards = max_shards
+        self.vectors = {}
+        self.shards = []
+        self.lock = threading.Lock()
+        if self.path and os.path.isdir(self.path):
+            self._load()
+
+    def key(self, text):
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def _load(self):
+        for name in sorted(os.listdir(self.path)):
+            if not (name.startswith('keys_') and name.endswith('.npy')):
+                continue
+            shard = name[len('keys_'):-len('.npy')]
+            try:
+                keys = np.load(os.path.join(self.path, name))
+                vectors = np.load(os.path.join(self.path, f'vectors_{shard}.npy'), mmap_mode='r')
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable embedding shard {shard}: {e}")
+                continue
+            self.shards.append(shard)
+            for key, vector in zip(keys.astype(str).tolist(), vectors):
+                self.vectors[key] = vector
+
+    def get_many(self, keys):
+        with self.lock:
+            return [self.vectors.get(k) for k in keys]
+
+    def put_many(self, keys, vectors):
+        with self.lock:
+            for key, vector in zip(keys, vectors):
+                self.vectors[key] = vector
+            if not self.path:
+                return
+            try:
+                self._write_shard(keys, vectors)
+                if len(self.shards) > self.max_shards:
+                    self._compact()
+            except OSError as e:
+                print(f"Embedding store not updated: {e}")
+
+    def _write_shard(self, keys, vectors):
+        os.makedirs(self.path, exist_ok=True)
+        shard = f"{time.time_ns()}_{os.getpid()}"
+        # Vectors land first; a shard only counts once its keys file exists
+        for name, array in ((f'vectors_{shard}.npy', np.asarray(vectors, dtype=np.float32)),
+                            (f'keys_{shard}.npy', np.array(keys, dtype='S40'))):
+            tmp_path = os.path.join(self.path, '.tmp-' + name)
+            with open(tmp_path, 'wb') as f:
+                np.save(f, array)
+            os.replace(tmp_path, os.path.join(self.path, name))
+        self.shards.append(shard)
+
+    def _compact(self):
+        old_shards = self.shards
+        self.shards = []
+        keys = list(self.vectors)
+        self._write_shard(keys, np.stack([self.vectors[k] for k in keys]))
+        for shard in old_shards:
+            for name in (f'keys_{shard}.npy', f'vectors_{shard}.npy'):
+                try:
+                    os.remove(os.path.join(self.path, name))
+                except OSError:
+                    pass
+
+def normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+class HashingEmbedder:
+    # Fallback: log-scaled term counts hashed into HASH_DIM buckets, so similarity is lexical overlap
+    model_id = f'hashing-{HASH_DIM}'
+
+    def encode(self, texts):
+        matrix = np.zeros((len(texts), HASH_DIM), dtype=np.float32)
+        for i, text in enumerate(texts):
+            buckets = [zlib.crc32(w.encode('utf-8')) % HASH_DIM for w in re.findall(r'\w+', text.lower())]
+            if buckets:
+                matrix[i] = np.bincount(buckets, minlength=HASH_DIM)
+        return normalize(np.log1p(matrix))
+
+class SentenceEmbedder:
+    def __init__(self, model_path, batch_size=EMBED_BATCH_SIZE):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_path, device='cpu')
+        self.model_id = os.path.basename(os.path.normpath(model_path))
+        self.batch_size = batch_size
+
+    def encode(self, texts):
+        vectors = self.model.encode(texts, batch_size=self.batch_size, convert_to_numpy=True, normalize_embeddings=True)
+        return np.asarray(vectors, dtype=np.float32)
+
+_embedder = None
+_stores = {}
+
+def get_embedder():
+    global _embedder
+    if _embedder is None:
+        try:
+            if not os.path.exists(EMBED_MODEL_PATH):
+                raise FileNotFoundError(f"'{EMBED_MODEL_PATH}' does not exist")
+            _embedder = SentenceEmbedder(EMBED_MODEL_PATH)
+        except Exception as e:
+            print(f"Embedding model not loaded ({e}) - using hashed bag-of-words vectors for sub-chunks.")
+            _embedder = HashingEmbedder()
+    return _embedder
+
+def store_for(embedder):
+    if embedder.model_id not in _stores:
+        # Hashed vectors are cheaper to recompute than to read back
+        path = EMBED_STORE_DIR if not isinstance(embedder, HashingEmbedder) else None
+        _stores[embedder.model_id] = VectorStore(embedder.model_id, path)
+    return _stores[embedder.model_id]
+
+def embed(texts):
+    # (len(texts), dim) unit vectors; only texts not already in the store reach the model, once each
+    embedder = get_embedder()
+    store = store_for(embedder)
+    keys = [store.key(t) for t in texts]
+    vectors = store.get_many(keys)
+    missing = {}
+    for i, vector in enumerate(vectors):
+        if vector is None:
+            missing.setdefault(keys[i], texts[i])
+    if missing:
+        new_keys = list(missing)
+        new_vectors = embedder.encode([missing[k] for k in new_keys])
+        store.put_many(new_keys, new_vectors)
+        found = dict(zip(new_keys, new_vectors))
+        vectors = [found[k] if v is None else v for k, v in zip(keys, vectors)]
+    return np.stack(vectors) if vectors else np.zeros((0, HASH_DIM), dtype=np.float32)
+
+@traced('top_chunks')
+def top_chunks(query, texts, groups, per_group=1):
+    # Indices into texts of the per_group most query-similar chunks of every group (section), ordered by
+    # group and best first within a group
+    if not texts:
+        return []
+    scores = embed(texts) @ embed([query])[0]
+    groups = np.asarray(groups)
+    order = np.lexsort((-scores, groups))
+    sorted_groups = groups[order]
+    starts = np.flatnonzero(np.r_[True, sorted_groups[1:] != sorted_groups[:-1]])
+    rank = np.arange(len(order)) - np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+    return order[rank < per_group].tolist()
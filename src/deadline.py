@@ -0,0 +1,90 @@
+# src/deadline.py
+# Cooperative time budget for one collection run. process_collection (and each service job) activates a
+# Deadline; pipeline stages check it and cut work as time runs out, recording every degradation so it can
+# be reported in the output metadata:
+#   parse  - cap pages per document up front, skip documents still parsing at the parse cutoff
+#   rank   - fewer rerank candidates and shorter texts, then BM25-only scoring, and stop the cascade early
+#   output - keep each section's first sub-chunk instead of ranking them
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+SLA_SECONDS = float(os.environ.get('SLA_SECONDS', 60))
+# Held back for writing the output and shutting the pool down
+SLA_MARGIN_SECONDS = float(os.environ.get('SLA_MARGIN_SECONDS', 5))
+# Share of the budget parsing may use before slow documents are skipped
+PARSE_SHARE = float(os.environ.get('PARSE_SHARE', 0.6))
+# Rough single-worker parse cost, used to cap pages per document before parsing starts
+PARSE_SECONDS_PER_PAGE = float(os.environ.get('PARSE_SECONDS_PER_PAGE', 0.05))
+# Remaining time below which ranking reduces candidates and text length, or drops the cross-encoder
+RERANK_REDUCED_SECONDS = float(os.environ.get('RERANK_REDUCED_SECONDS', 20))
+RERANK_MIN_SECONDS = float(os.environ.get('RERANK_MIN_SECONDS', 8))
+# Remaining time below which sub-chunks are not embedded
+EMBED_MIN_SECONDS = float(os.environ.get('EMBED_MIN_SECONDS', 3))
+
+class Deadline:
+    def __init__(self, seconds=SLA_SECONDS, margin=SLA_MARGIN_SECONDS):
+        self.seconds = seconds
+        self.start = time.monotonic()
+        self.end = self.start + max(0.0, seconds - margin)
+        self.stage_seconds = {}
+        self.degradations = []
+
+    def elapsed(self):
+        return time.monotonic() - self.start
+
+    def remaining(self):
+        return self.end - time.monotonic()
+
+    def at(self, share):
+        # Monotonic time at which the given share of the usable budget is spent
+        return self.start + share * (self.end - self.start)
+
+    @contextmanager
+    def stage(self, name):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.stage_seconds[name] = self.stage_seconds.get(name, 0.0) + time.monotonic() - start
+
+    def degrade(self, stage, action, detail):
+        self.degradations.append({"stage": stage, "action": action, "detail": detail})
+        print(f"Deadline: {action} ({detail}) at {self.elapsed():.1f}s of {self.seconds:.0f}s")
+
+    def summary(self):
+        return ', '.join(f"{name} {seconds:.2f}s" for name, seconds in self.stage_seconds.items())
+
+_local = threading.local()
+
+def current():
+    # The Deadline active on this thread, or None for unbounded runs
+    return getattr(_local, 'deadline', None)
+
+@contextmanager
+def activate(deadline):
+    previous = current()
+    _local.deadline = deadline
+    try:
+        yield deadline
+    finally:
+        _local.deadline = previous
+
+def stage(name):
+    deadline = current()
+    return deadline.stage(name) if deadline else nullcontext()
+
+def page_cap(pages, allowed_pages):
+    # Largest per-document page limit c with sum(min(p, c)) <= allowed_pages, so small documents stay whole;
+    # None when every page fits
+    if sum(pages) <= allowed_pages:
+        return None
+    remaining = allowed_pages
+    ordered = sorted(pages)
+    for k, p in enumerate(ordered):
+        share = remaining / (len(ordered) - k)
+        if p > share:
+            return max(1, int(share))
+        remaining -= p
+    return None
@@ -1,34 +1,123 @@
 # src/extract_outline.py (full updated version)
-import json
 import os
 import traceback  # For better error logging
-from pdf_utils import load_pdf, extract_text_blocks, calculate_document_stats, extract_title, build_outline
+from pdf_utils import load_pdf, page_count, extract_page_blocks, extract_page_range_blocks, extract_title, streaming_document_stats, stream_outline
+from block_store import BlockStore
+from parse_cache import CACHE_DIR, parse_pdf, file_key, has_entry, parse_blocks
 from multiprocess import Pool  # Import here
+from json_writer import write_json, with_extension
+from shm_transport import export_arrays, import_arrays
+from tracing import span, session, wrap_task, unwrap_results, pool_imap_unordered
+
+# Documents with at least this many pages are streamed page by page instead of parsed whole
+STREAM_MIN_PAGES = int(os.environ.get('STREAM_MIN_PAGES', 2000))
+# Documents with at least SHARD_MIN_PAGES pages are split into SHARD_PAGES-page ranges parsed in parallel
+SHARD_MIN_PAGES = int(os.environ.get('SHARD_MIN_PAGES', 64))
+SHARD_PAGES = int(os.environ.get('SHARD_PAGES', 32))
+# Pages sampled for font stats when streaming (0 = exact pass over every page)
+STREAM_SAMPLE_PAGES = int(os.environ.get('STREAM_SAMPLE_PAGES', 0))
+
+def available_cpus():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # Not available on macOS/Windows
+        return os.cpu_count() or 1
+
+def stream_single_pdf(pdf_path, output_path):
+    doc = load_pdf(pdf_path)
+    try:
+        stats = streaming_document_stats(doc, STREAM_SAMPLE_PAGES or None)
+        title = extract_title(extract_page_blocks(doc[0], 0)) if len(doc) else "Untitled"
+        write_json(output_path, {'title': title}, [('outline', stream_outline(doc, stats))])  # Entries written as they arrive
+    finally:
+        doc.close()
+
+def write_outline(output_path, blocks, outline):
+    entries = ({'level': e['level'], 'text': e['text'], 'page': e['page']} for e in outline)
+    write_json(output_path, {'title': extract_title(blocks)}, [('outline', entries)])
+
+def extract_shard(args):
+    # Blocks go back through shared memory; only (doc, shard, handle, error) is sent over the pipe
+    doc_index, shard_index, pdf_path, start, end = args
+    try:
+        return doc_index, shard_index, export_arrays(extract_page_range_blocks(pdf_path, start, end).arrays()), None
+    except Exception as e:
+        return doc_index, shard_index, None, f"{str(e)} - Full traceback: {traceback.format_exc()}"
 
 def process_single_pdf(args):
-    filename, input_dir, output_dir = args
+    filename, input_dir, output_dir, streaming = args
     try:
         pdf_path = os.path.join(input_dir, filename)
-        doc = load_pdf(pdf_path)
-        blocks = extract_text_blocks(doc)  # Now single-threaded
-        stats = calculate_document_stats(blocks)
-        title = extract_title(blocks)
-        outline = build_outline(blocks, stats)
-        output = {"title": title, "outline": outline}
-        json_filename = filename.replace('.pdf', '.json')
-        with open(os.path.join(output_dir, json_filename), 'w', encoding='utf-8') as f:
-            json.dump(output, f, indent=4, ensure_ascii=False)
-        doc.close()
+        json_path = with_extension(os.path.join(output_dir, filename.replace('.pdf', '')))
+        if streaming:  # Memory stays flat regardless of page count
+            stream_single_pdf(pdf_path, json_path)
+            return f"Processed {filename} (streamed)"
+        blocks, outline, _ = parse_pdf(pdf_path)  # Cached by content hash
+        write_outline(json_path, blocks, outline)
         return f"Processed {filename}"
     except Exception as e:
         return f"Error processing {filename}: {str(e)} - Full traceback: {traceback.format_exc()}"
 
 def process_all_pdfs(input_dir, output_dir):
+    with session('process_all_pdfs'):
+        _process_all_pdfs(input_dir, output_dir)
+
+def _process_all_pdfs(input_dir, output_dir):
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
-    pdf_files = [f for f in os.listdir(input_dir) if f.endswith('.pdf')]
-    with Pool(processes=4) as pool:  # Parallel here
-        results = pool.map(process_single_pdf, [(f, input_dir, output_dir) for f in pdf_files])
+    results = []
+    pages, keys = {}, {}
+    for f in (f for f in os.listdir(input_dir) if f.endswith('.pdf')):
+        pdf_path = os.path.join(input_dir, f)
+        try:
+            keys[f] = file_key(pdf_path) if CACHE_DIR else None
+            # Cached files are loaded whole without PyMuPDF, so their page count is never needed
+            pages[f] = 0 if has_entry(keys[f]) else page_count(pdf_path)
+        except Exception as e:
+            results.append(f"Error processing {f}: {str(e)} - Full traceback: {traceback.format_exc()}")
+    pdf_files = sorted(pages, key=lambda f: -pages[f])  # Largest first so they don't become the tail
+    workers = available_cpus()
+
+    whole, sharded = [], []
+    for f in pdf_files:
+        if workers > 1 and SHARD_MIN_PAGES <= pages[f] < STREAM_MIN_PAGES:
+            sharded.append((f, keys[f]))
+        else:
+            whole.append(f)
+    n_shards = [len(range(0, pages[f], SHARD_PAGES)) for f, _ in sharded]
+    shard_tasks = [
+        (i, j, os.path.join(input_dir, f), start, min(start + SHARD_PAGES, pages[f]))
+        for i, (f, _) in enumerate(sharded) for j, start in enumerate(range(0, pages[f], SHARD_PAGES))
+    ]
+
+    with Pool(processes=workers) as pool, span('pool.map', tasks=len(shard_tasks) + len(whole)):
+        # Shards are queued ahead of whole documents, so big files start first
+        shard_results = pool_imap_unordered(pool, extract_shard, shard_tasks, 'shards')
+        whole_async = pool.map_async(wrap_task(process_single_pdf), [
+            (f, input_dir, output_dir, pages[f] >= STREAM_MIN_PAGES) for f in whole
+        ])
+        parts = [{} for _ in sharded]
+        # Each document is merged as soon as its last shard lands, while other shards are still parsing
+        for i, j, handle, err in shard_results:
+            parts[i][j] = (BlockStore(**import_arrays(handle)) if handle else None, err)
+            if len(parts[i]) < n_shards[i]:
+                continue
+            f, key = sharded[i]
+            doc_parts = [parts[i][j] for j in range(n_shards[i])]
+            parts[i] = None
+            errors = [err for _, err in doc_parts if err]
+            if errors:
+                results.append(f"Error processing {f}: {errors[0]}")
+                continue
+            try:
+                # Shards are concatenated in page order, so this matches a single-pass parse
+                blocks = BlockStore.concat(shard_blocks for shard_blocks, _ in doc_parts)
+                _, outline, _ = parse_blocks(blocks, key)
+                write_outline(with_extension(os.path.join(output_dir, f.replace('.pdf', ''))), blocks, outline)
+                results.append(f"Processed {f} ({n_shards[i]} shards)")
+            except Exception as e:
+                results.append(f"Error processing {f}: {str(e)} - Full traceback: {traceback.format_exc()}")
+        results.extend(unwrap_results(whole_async.get()))
     for res in results:
         print(res)
 
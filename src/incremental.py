@@ -0,0 +1,123 @@
+# src/incremental.py
+# Incremental 1B runs: a per-collection state file keeps each document's content hash, BM25 tokens and
+# the cross-encoder scores already paid for; parsed sections sit next to it as packed arrays, one .npz per
+# document hash. A re-run parses and tokenizes only added or
+# changed PDFs, drops removed ones, re-ranks the collection and rewrites results_<challenge_id>.json.
+# Usage: python src/incremental.py [input_dir] [output_dir]
+import json
+import os
+import sys
+import time
+import numpy as np
+from multiprocess import Pool
+from json_writer import with_extension
+from parse_cache import file_key
+from pdf_utils import pack_sections, unpack_sections
+from persona_intelligence import (iter_parsed_documents, rank_collection, build_query, tokenize_for_bm25, cache_for,
+                                  write_output_data,
+                                  local_model_path, PARSE_WORKERS)
+
+STATE_VERSION = 2
+
+def state_path(output_dir, challenge_id):
+    return os.path.join(output_dir, f".state_{challenge_id}.json")
+
+def sections_path(path, doc_hash):
+    return os.path.join(path[:-len('.json')] + '.sections', f"{doc_hash}.npz")
+
+def load_sections(path, doc_hash, doc_name):
+    try:
+        with np.load(sections_path(path, doc_hash)) as arrays:
+            sections = unpack_sections(dict(arrays))
+    except (OSError, ValueError, KeyError, IndexError):
+        return None
+    for section in sections:
+        section['doc'] = doc_name
+    return sections
+
+def save_sections(path, doc_hash, sections):
+    os.makedirs(os.path.dirname(sections_path(path, doc_hash)), exist_ok=True)
+    np.savez_compressed(sections_path(path, doc_hash), **pack_sections(sections))
+
+def prune_sections(path, hashes):
+    directory = path[:-len('.json')] + '.sections'
+    keep = {f"{h}.npz" for h in hashes}
+    for name in os.listdir(directory) if os.path.isdir(directory) else []:
+        if name not in keep:
+            os.remove(os.path.join(directory, name))
+
+def load_state(path, query):
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            if state.get('version') == STATE_VERSION:
+                if state.get('query') != query:
+                    state['rerank'] = {}  # Cross-encoder scores belong to one query
+                    state['query'] = query
+                return state
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable state file {path}: {e}")
+    return {'version': STATE_VERSION, 'query': query, 'documents': {}, 'rerank': {}}
+
+def save_state(path, state):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def update_collection(input_dir, output_dir):
+    start_time = time.time()
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    with open(os.path.join(input_dir, 'config.json'), 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    challenge_id = config['challenge_info']['challenge_id']
+    documents = config['documents']
+    query = build_query(config['job_to_be_done']['task'], config['persona']['role'])
+    path = state_path(output_dir, challenge_id)
+    state = load_state(path, query)
+
+    hashes = {}
+    sections_by_doc = {}
+    changed = []
+    for d in documents:
+        pdf_path = os.path.join(input_dir, d['filename'])
+        hashes[d['filename']] = file_key(pdf_path) if os.path.exists(pdf_path) else None
+        previous = state['documents'].get(d['filename'])
+        if previous is not None and previous['hash'] == hashes[d['filename']]:
+            sections_by_doc[d['filename']] = load_sections(path, previous['hash'], d['filename'])
+        if sections_by_doc.get(d['filename']) is None:  # New, changed, or its sections file is gone
+            changed.append(d)
+    removed = set(state['documents']) - set(hashes)
+    for name in removed:
+        del state['documents'][name]
+    print(f"{len(changed)} new or changed, {len(removed)} removed, {len(documents) - len(changed)} unchanged")
+
+    if changed:
+        with Pool(processes=max(1, min(PARSE_WORKERS, len(changed)))) as pool:
+            for i, sections in iter_parsed_documents(changed, input_dir, pool):
+                d = changed[i]
+                tokens, _ = tokenize_for_bm25([s['refined_text'][:500] for s in sections], query)
+                save_sections(path, hashes[d['filename']], sections)
+                sections_by_doc[d['filename']] = sections
+                state['documents'][d['filename']] = {'hash': hashes[d['filename']], 'tokens': tokens}
+
+    # Known rerank scores go straight into the in-memory cache, so only new candidates reach the model
+    score_cache = cache_for(local_model_path)
+    score_cache.seed(state['rerank'].items())
+    results = [sections_by_doc[d['filename']] for d in documents]
+    doc_tokens = [state['documents'][d['filename']]['tokens'] for d in documents]
+    output_data = rank_collection(config, results, doc_tokens)
+
+    keys = [score_cache.key(query, s['refined_text'][:500]) for sections in results for s in sections]
+    state['rerank'] = score_cache.peek(keys)
+    save_state(path, state)
+    prune_sections(path, [doc['hash'] for doc in state['documents'].values()])
+    output_filename = with_extension(os.path.join(output_dir, f"results_{challenge_id}"))
+    write_output_data(output_filename, output_data)
+    print(f"Output saved to {output_filename}")
+    print(f"Processing time: {time.time() - start_time} seconds")
+
+if __name__ == '__main__':
+    update_collection(sys.argv[1] if len(sys.argv) > 1 else 'input/', sys.argv[2] if len(sys.argv) > 2 else 'output/')
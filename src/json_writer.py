@@ -0,0 +1,126 @@
+# src/json_writer.py
+# Streaming writer for the output files. The header fields are written first, then each list is written
+# item by item from any iterable, so results never need to be serialized as one big string.
+# OUTPUT_FORMAT picks the layout:
+#   pretty  - same bytes as json.dump(..., indent=4, ensure_ascii=False) for finite numbers (default)
+#   compact - one line, no whitespace
+#   ndjson  - one JSON object per line: a {"type": "header", ...} line, then {"type": <list name>, ...item}
+# OUTPUT_SERIALIZER=orjson (or auto, when it is installed) speeds up compact and ndjson items.
+# NaN and infinities are written as null in every format and with either serializer, as orjson does.
+import json
+import os
+from json.encoder import encode_basestring
+
+OUTPUT_FORMAT = os.environ.get('OUTPUT_FORMAT', 'pretty')
+OUTPUT_SERIALIZER = os.environ.get('OUTPUT_SERIALIZER', 'auto')
+FORMATS = ('pretty', 'compact', 'ndjson')
+
+_encoder = json.JSONEncoder(ensure_ascii=False, allow_nan=False)
+_compact = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), allow_nan=False)
+
+def finite(obj):
+    # Copy of obj with non-finite floats replaced by None
+    if isinstance(obj, float):
+        return obj if obj - obj == 0 else None
+    if isinstance(obj, dict):
+        return {k: finite(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [finite(v) for v in obj]
+    return obj
+
+def _compact_json(obj):
+    try:
+        return _compact.encode(obj)
+    except ValueError:  # Out-of-range float; only then is the copy made
+        return _compact.encode(finite(obj))
+
+def compact_encoder(serializer=OUTPUT_SERIALIZER):
+    if serializer in ('auto', 'orjson'):
+        try:
+            import orjson
+            return lambda obj: orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY).decode('utf-8')
+        except ImportError:
+            if serializer == 'orjson':
+                raise ImportError("OUTPUT_SERIALIZER=orjson needs orjson (pip install orjson).")
+    return _compact_json
+
+def with_extension(base, fmt=OUTPUT_FORMAT):
+    return base + ('.ndjson' if fmt == 'ndjson' else '.json')
+
+_float_repr = float.__repr__
+
+def scalar(value):
+    # json.dumps for one scalar without building an encoder per call; TypeError for containers
+    cls = type(value)
+    if cls is str:
+        return encode_basestring(value)
+    if cls is int:
+        return int.__repr__(value)
+    if value is None:
+        return 'null'
+    if value is True:
+        return 'true'
+    if value is False:
+        return 'false'
+    if cls is float and value - value == 0:  # Finite
+        return _float_repr(value)
+    if isinstance(value, float) and value - value != 0:
+        return 'null'
+    if isinstance(value, (str, int, float)):
+        return _encoder.encode(value)
+    raise TypeError(cls.__name__)
+
+_key_prefixes = {}
+
+def pretty(obj, indent):
+    # json.dumps(obj, indent=4) nested at the given depth. Flat dicts (every output list item) are formatted
+    # directly with their key prefixes cached per key set, instead of through the pure-Python indent encoder
+    if type(obj) is dict and obj:
+        keys = tuple(obj)
+        try:
+            prefixes = _key_prefixes.get((keys, indent))
+            if prefixes is None:
+                pad = ' ' * (indent + 4)
+                prefixes = _key_prefixes[(keys, indent)] = [pad + encode_basestring(k) + ': ' for k in keys]
+            body = ',\n'.join([p + scalar(v) for p, v in zip(prefixes, obj.values())])
+            return '{\n' + body + '\n' + ' ' * indent + '}'
+        except TypeError:
+            pass
+    try:
+        text = json.dumps(obj, indent=4, ensure_ascii=False, allow_nan=False)
+    except ValueError:
+        text = json.dumps(finite(obj), indent=4, ensure_ascii=False)
+    return text.replace('\n', '\n' + ' ' * indent)
+
+def write_json(path, header, lists, fmt=OUTPUT_FORMAT):
+    # header: dict of fields written whole; lists: (name, iterable of items) pairs streamed in order
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown OUTPUT_FORMAT '{fmt}', choose one of {FORMATS}")
+    encode = compact_encoder() if fmt != 'pretty' else None
+    with open(path, 'w', encoding='utf-8', buffering=1 << 20) as f:
+        if fmt == 'ndjson':
+            f.write(encode({'type': 'header', **header}) + '\n')
+            for name, items in lists:
+                for item in items:
+                    f.write(encode({'type': name, **item}) + '\n')
+            return
+        if fmt == 'compact':
+            fields = [encode_basestring(k) + ':' + encode(v) for k, v in header.items()]
+            f.write('{' + ','.join(fields))
+            for n, (name, items) in enumerate(lists):
+                f.write((',' if fields or n else '') + encode_basestring(name) + ':[')
+                for i, item in enumerate(items):
+                    f.write((',' if i else '') + encode(item))
+                f.write(']')
+            f.write('}')
+            return
+        fields = ['    ' + encode_basestring(k) + ': ' + pretty(v, 4) for k, v in header.items()]
+        f.write('{\n' + ',\n'.join(fields))
+        for n, (name, items) in enumerate(lists):
+            f.write((',\n' if fields or n else '') + '    ' + encode_basestring(name) + ': [')
+            first = True
+            for item in items:
+                f.write(('\n        ' if first else ',\n        ') + pretty(item, 8))
+                first = False
+            f.write(']' if first else '\n    ]')
+        f.write('\n}')
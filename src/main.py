@@ -1,12 +1,16 @@
 # src/main.py (updated)
 import sys
-from extract_outline import process_all_pdfs
-from persona_intelligence import process_collection
 
 if __name__ == '__main__':
     input_dir = '/app/input/' if len(sys.argv) > 1 and sys.argv[1] == 'docker' else 'input/'
     output_dir = '/app/output/' if len(sys.argv) > 1 and sys.argv[1] == 'docker' else 'output/'
+    # Import only the pipeline for the chosen mode so outline jobs never load the reranker stack
     if len(sys.argv) > 1 and sys.argv[1] == '1b':
+        from persona_intelligence import process_collection
         process_collection(input_dir, output_dir)
+    elif len(sys.argv) > 1 and sys.argv[1] == '1b-incremental':
+        from incremental import update_collection
+        update_collection(input_dir, output_dir)
     else:
-        process_all_pdfs(input_dir, output_dir)
\ No newline at end of file
+        from extract_outline import process_all_pdfs
+        process_all_pdfs(input_dir, output_dir)
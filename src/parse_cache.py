@@ -0,0 +1,105 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+from block_store import BlockStore
+from pdf_utils import PARSER_VERSION, pack_sections, unpack_sections, section_bodies, load_pdf, extract_text_blocks, calculate_document_stats, build_outline, extract_section_text
+
+# Set PDF_CACHE_DIR to an empty string to disable the cache
+CACHE_DIR = os.environ.get('PDF_CACHE_DIR', '.cache/pdf')
+CACHE_MAX_BYTES = int(os.environ.get('PDF_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+
+def file_key(pdf_path):
+    h = hashlib.sha256(PARSER_VERSION.encode('utf-8'))
+    with open(pdf_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def load_entry(key, cache_dir=CACHE_DIR):
+    entry_dir = os.path.join(cache_dir, key)
+    meta_path = os.path.join(entry_dir, 'meta.json')
+    if not os.path.exists(meta_path):
+        return None
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        blocks = BlockStore.load(entry_dir)  # Memory-mapped, pages are read on first touch
+        with np.load(os.path.join(entry_dir, 'sections.npz')) as arrays:
+            sections = unpack_sections(dict(arrays), section_bodies(blocks, meta['outline']))
+        os.utime(entry_dir)  # Mark as recently used for eviction
+        return blocks, meta['outline'], sections
+    except (OSError, ValueError, KeyError, IndexError) as e:
+        print(f"Ignoring unreadable cache entry {key}: {e}")
+        return None
+
+def store_entry(key, blocks, outline, sections, cache_dir=CACHE_DIR):
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=cache_dir, prefix='.tmp-')
+    try:
+        BlockStore.from_blocks(blocks).save(tmp_dir)
+        # Section bodies are rebuilt from the blocks on load, so sub-chunks cost only their offsets
+        np.savez(os.path.join(tmp_dir, 'sections.npz'), **pack_sections(sections, with_body=False))
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump({'outline': outline}, f, ensure_ascii=False)
+        os.rename(tmp_dir, os.path.join(cache_dir, key))
+    except OSError:
+        # Another worker stored the same file first
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+def _dir_size(path):
+    return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+
+def evict(cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+    entries = []
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if name.startswith('.') or not os.path.isdir(path):
+            continue
+        try:
+            entries.append((os.path.getmtime(path), _dir_size(path), path))
+        except OSError:
+            continue
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):  # Least recently used first
+        if total <= max_bytes:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+
+def has_entry(key, cache_dir=CACHE_DIR):
+    return bool(key) and os.path.exists(os.path.join(cache_dir, key, 'meta.json'))
+
+def lookup(pdf_path, cache_dir=CACHE_DIR):
+    # Returns (key, cached entry or None); key is None when caching is disabled
+    key = file_key(pdf_path) if cache_dir else None
+    return key, (load_entry(key, cache_dir) if key else None)
+
+def parse_blocks(blocks, key=None, cache_dir=CACHE_DIR):
+    # Outline and sections only need the blocks, so merged page-range shards finish here too
+    stats = calculate_document_stats(blocks)
+    outline = build_outline(blocks, stats)
+    sections = extract_section_text(None, outline, blocks)
+    if key:
+        try:  # The cache is best-effort; a failed write never fails the parse
+            store_entry(key, blocks, outline, sections, cache_dir)
+            evict(cache_dir)
+        except OSError as e:
+            print(f"Parse cache not updated: {e}")
+    return blocks, outline, sections
+
+def parse_pdf(pdf_path, cache_dir=CACHE_DIR, max_pages=None):
+    # max_pages parses only the first pages of an uncached file; such partial parses are not cached
+    key, cached = lookup(pdf_path, cache_dir)
+    if cached is not None:
+        return cached
+    doc = load_pdf(pdf_path)
+    try:
+        if max_pages is not None and len(doc) > max_pages:
+            key = None
+        blocks = extract_text_blocks(doc, max_pages)
+    finally:
+        doc.close()
+    return parse_blocks(blocks, key, cache_dir)
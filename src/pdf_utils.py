@@ -1,40 +1,121 @@
+import bisect
 import fitz
 import re
 import statistics
 from collections import namedtuple
 import unicodedata
+import numpy as np
+from tracing import traced
+from block_store import TextBlock, BlockStore
+from shm_transport import pack_records, unpack_records
 
-TextBlock = namedtuple('TextBlock', ['text', 'font_size', 'flags', 'bbox', 'page'])
+# Columnar view of a block list: text is a list, the rest are NumPy arrays (bbox has shape (n, 4))
+BlockColumns = namedtuple('BlockColumns', ['text', 'font_size', 'flags', 'bbox', 'page'])
 
+HEADING_PATTERN = re.compile(
+    r'\d+\.\s|\d+\.\d+\s|[A-Z]\.\s|(?:Chapter|Section|部|章)'
+    r'|[IVX]+\.\s|(?:Abstract|Introduction|結論|概要)|\d+\s|S\.No\s',
+    re.IGNORECASE | re.UNICODE
+)
+
+# subsection_analysis sub-chunks: whole sentences packed up to CHUNK_MAX_WORDS, closed once CHUNK_MIN_WORDS is reached
+CHUNK_MIN_WORDS = 200
+CHUNK_MAX_WORDS = 300
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+# Section and sub-chunk fields as packed into arrays for the parse cache, parse workers and incremental state
+SECTION_TEXT_FIELDS = ('title', 'refined_text', 'level')
+SECTION_INT_FIELDS = ('page',)
+CHUNK_FIELDS = ('section', 'start', 'end', 'page')
+
+# Bump whenever block extraction, outline or section logic changes so cached parses are invalidated
+PARSER_VERSION = '4'
+
+@traced('load_pdf')
 def load_pdf(pdf_path):
     return fitz.open(pdf_path)
 
-def extract_text_blocks(doc):
+# Image blocks are never used, so skip decoding them into the page dict
+TEXT_DICT_FLAGS = fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES
+
+def page_count(pdf_path):
+    with fitz.open(pdf_path) as doc:
+        return len(doc)
+
+def extract_page_blocks(page, page_num):
     blocks = []
-    for page_num in range(len(doc)):
-        page = doc[page_num]
-        page_blocks = page.get_text("dict")["blocks"]
-        for b in page_blocks:
-            if 'lines' in b:
-                for line in b['lines']:
-                    for span in line['spans']:
-                        text = unicodedata.normalize('NFKC', span['text'].strip()).replace('  ', ' ')
-                        if text:
-                            blocks.append(TextBlock(
-                                text=text,
-                                font_size=span['size'],
-                                flags=span['flags'],
-                                bbox=span['bbox'],
-                                page=page_num + 1
-                            ))
+    page_blocks = page.get_text("dict", flags=TEXT_DICT_FLAGS)["blocks"]
+    for b in page_blocks:
+        if 'lines' in b:
+            for line in b['lines']:
+                for span in line['spans']:
+                    text = unicodedata.normalize('NFKC', span['text'].strip()).replace('  ', ' ')
+                    if text:
+                        blocks.append(TextBlock(
+                            text=text,
+                            font_size=span['size'],
+                            flags=span['flags'],
+                            bbox=span['bbox'],
+                            page=page_num + 1
+                        ))
     return blocks
 
+def iter_page_blocks(doc, max_pages=None):
+    # Yields one page's blocks at a time; only the current page's text dict is alive
+    for page_num in range(min(len(doc), max_pages) if max_pages is not None else len(doc)):
+        yield extract_page_blocks(doc[page_num], page_num)
+
+@traced('extract_text_blocks')
+def extract_text_blocks(doc, max_pages=None):
+    # Only one page's TextBlock tuples are alive at a time; the document's blocks live in one BlockStore
+    return BlockStore.concat(BlockStore.from_blocks(page_blocks) for page_blocks in iter_page_blocks(doc, max_pages))
+
+@traced('extract_page_range_blocks')
+def extract_page_range_blocks(pdf_path, start, end):
+    # Opens its own handle so page-range shards can run in separate processes
+    with fitz.open(pdf_path) as doc:
+        return BlockStore.concat(BlockStore.from_blocks(extract_page_blocks(doc[page_num], page_num))
+                                 for page_num in range(start, end))
+
 def calculate_document_stats(blocks):
-    font_sizes = [b.font_size for b in blocks if b.font_size > 0]
+    if isinstance(blocks, BlockStore):
+        font_sizes = blocks.font_size[blocks.font_size > 0].tolist()
+    else:
+        font_sizes = [b.font_size for b in blocks if b.font_size > 0]
     avg_font_size = statistics.mean(font_sizes) if font_sizes else 10
     font_size_std = statistics.stdev(font_sizes) if len(font_sizes) > 1 else 0
     return {'avg_font_size': avg_font_size, 'font_size_std': font_size_std}
 
+class RunningStats:
+    # Welford's online mean/variance, so font stats need no block list
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def as_stats(self):
+        avg_font_size = self.mean if self.count else 10
+        font_size_std = (self.m2 / (self.count - 1)) ** 0.5 if self.count > 1 else 0
+        return {'avg_font_size': avg_font_size, 'font_size_std': font_size_std}
+
+def streaming_document_stats(doc, sample_pages=None):
+    # Exact pass over every page by default; sample_pages limits it to that many evenly spaced pages
+    running = RunningStats()
+    pages = range(len(doc))
+    if sample_pages and len(doc) > sample_pages:
+        step = len(doc) / sample_pages
+        pages = sorted({int(i * step) for i in range(sample_pages)})
+    for page_num in pages:
+        for block in extract_page_blocks(doc[page_num], page_num):
+            if block.font_size > 0:
+                running.add(block.font_size)
+    return running.as_stats()
+
 def is_heading(block, stats, prev_block=None):
     score = 0
     if block.font_size > stats['avg_font_size'] + (stats['font_size_std'] * 0.5):
@@ -46,11 +127,7 @@ def is_heading(block, stats, prev_block=None):
     words = len(block.text.split())
     if 1 <= words <= 12:
         score += 1
-    patterns = [
-        r'^\d+\.\s', r'^\d+\.\d+\s', r'^[A-Z]\.\s', r'^(Chapter|Section|部|章)',
-        r'^[IVX]+\.\s', r'^(Abstract|Introduction|結論|概要)', r'^\d+\s', r'^S\.No\s'
-    ]
-    if any(re.match(p, block.text, re.IGNORECASE | re.UNICODE) for p in patterns):
+    if HEADING_PATTERN.match(block.text):
         score += 4
     cap_ratio = sum(1 for c in block.text if c.isupper()) / len(block.text) if len(block.text) > 0 else 0
     if cap_ratio > 0.5:
@@ -63,6 +140,75 @@ def is_heading(block, stats, prev_block=None):
         score += 1
     return score >= 4  # Tuned threshold
 
+def to_columns(blocks):
+    if isinstance(blocks, BlockStore):
+        return BlockColumns(
+            text=blocks.texts(),
+            font_size=blocks.font_size.astype(np.float64),
+            flags=blocks.flags.astype(np.int64),
+            bbox=blocks.bbox.astype(np.float64).reshape(-1, 4),
+            page=blocks.page.astype(np.int64)
+        )
+    return BlockColumns(
+        text=[b.text for b in blocks],
+        font_size=np.array([b.font_size for b in blocks], dtype=np.float64),
+        flags=np.array([b.flags for b in blocks], dtype=np.int64),
+        bbox=np.array([b.bbox for b in blocks], dtype=np.float64).reshape(-1, 4),
+        page=np.array([b.page for b in blocks], dtype=np.int64)
+    )
+
+_bmp_tables = None
+
+def _char_tables():
+    # isupper/isspace for every BMP code point, built once per process
+    global _bmp_tables
+    if _bmp_tables is None:
+        chars = [chr(c) for c in range(0x10000)]
+        _bmp_tables = (np.fromiter((c.isupper() for c in chars), dtype=bool, count=0x10000),
+                       np.fromiter((c.isspace() for c in chars), dtype=bool, count=0x10000))
+    return _bmp_tables
+
+def text_features(texts):
+    # Per-text length, uppercase count and str.split() word count from one pass over the joined code points
+    lengths = np.fromiter((len(t) for t in texts), dtype=np.int64, count=len(texts))
+    codes = np.frombuffer(''.join(texts).encode('utf-32-le', 'surrogatepass'), dtype=np.uint32)
+    upper_table, space_table = _char_tables()
+    bmp = np.minimum(codes, 0xFFFF)
+    upper = upper_table[bmp]
+    space = space_table[bmp]
+    for i in np.flatnonzero(codes > 0xFFFF):
+        upper[i] = chr(codes[i]).isupper()
+        space[i] = False
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+    # A word starts at a non-space char that opens a text or follows a space
+    word_start = ~space
+    if len(codes) > 1:
+        word_start[1:] &= space[:-1]
+    word_start[starts[lengths > 0]] = ~space[starts[lengths > 0]]
+    upper_cum = np.concatenate([[0], np.cumsum(upper)])
+    word_cum = np.concatenate([[0], np.cumsum(word_start)])
+    return lengths, upper_cum[ends] - upper_cum[starts], word_cum[ends] - word_cum[starts]
+
+def heading_scores(columns, stats):
+    # Same features and weights as is_heading, computed for every block at once
+    texts = columns.text
+    font_size, flags, bbox = columns.font_size, columns.flags, columns.bbox
+    score = np.zeros(len(texts), dtype=np.int64)
+    score += 3 * (font_size > stats['avg_font_size'] + (stats['font_size_std'] * 0.5))
+    score += 3 * ((flags & (1 << 4)) != 0)  # Bold
+    score += 1 * ((flags & (1 << 1)) != 0)  # Italic
+    lengths, uppers, words = text_features(texts)
+    score += 1 * ((words >= 1) & (words <= 12))
+    match = HEADING_PATTERN.match
+    score += 4 * np.fromiter((match(t) is not None for t in texts), dtype=bool, count=len(texts))
+    score += 2 * (2 * uppers > lengths)  # Capital ratio above 0.5
+    score += 2 * (bbox[:, 1] < 200)
+    if len(texts) > 1:
+        score[1:] += 3 * (bbox[1:, 1] - bbox[:-1, 3] > 20)
+    score += 1 * (bbox[:, 2] - bbox[:, 0] < 300)
+    return score
+
 def determine_level(block, stats):
     ratio = block.font_size / stats['avg_font_size']
     if ratio > 1.6:
@@ -78,31 +224,163 @@ def extract_title(blocks):
             return b.text
     return "Untitled"
 
+@traced('build_outline')
 def build_outline(blocks, stats):
     outline = []
     seen_texts = set()
-    prev_block = None
-    for block in blocks:
-        if is_heading(block, stats, prev_block) and block.text not in seen_texts:
+    candidates = np.flatnonzero(heading_scores(to_columns(blocks), stats) >= 4)  # Tuned threshold
+    for i in candidates:
+        block = blocks[i]
+        if block.text not in seen_texts:
             seen_texts.add(block.text)
             level = determine_level(block, stats)
-            outline.append({"level": level, "text": block.text, "page": block.page})
-        prev_block = block
+            # 'block' is the heading's index in blocks, where its section starts; it is not written out
+            outline.append({"level": level, "text": block.text, "page": block.page, "block": int(i)})
     return outline
 
-def extract_section_text(doc, outline):
+def stream_outline(doc, stats):
+    # Generator twin of build_outline: scores one page at a time and yields entries as they are found
+    seen_texts = set()
+    prev_block = None
+    for page_blocks in iter_page_blocks(doc):
+        if not page_blocks:
+            continue
+        # Carry the previous page's last block so the vertical-gap feature matches build_outline
+        scored = [prev_block] + page_blocks if prev_block else page_blocks
+        scores = heading_scores(to_columns(scored), stats)
+        if prev_block:
+            scores = scores[1:]
+        for i in np.flatnonzero(scores >= 4):  # Tuned threshold
+            block = page_blocks[i]
+            if block.text not in seen_texts:
+                seen_texts.add(block.text)
+                yield {"level": determine_level(block, stats), "text": block.text, "page": block.page}
+        prev_block = page_blocks[-1]
+
+def _refine(parts):
+    return ' '.join(' '.join(parts).split())[:1000]  # Clean and truncate
+
+def _sentences(parts, pages):
+    # (words, page) per sentence; a sentence belongs to the page its first character is on
+    text = ' '.join(parts)
+    part_starts = []
+    offset = 0
+    for part in parts:
+        part_starts.append(offset)
+        offset += len(part) + 1
+    bounds = [0] + [m.end() for m in SENTENCE_END.finditer(text)] + [len(text)]
+    for start, end in zip(bounds, bounds[1:]):
+        words = text[start:end].split()
+        if words:
+            yield words, pages[bisect.bisect_right(part_starts, start) - 1]
+
+def chunk_text(parts, pages, min_words=CHUNK_MIN_WORDS, max_words=CHUNK_MAX_WORDS):
+    # Splits a section's text parts (with the page of each part) into sentence-aligned chunks
+    chunks = []
+    words = []
+    page = None
+    for sentence, sentence_page in _sentences(parts, pages):
+        if words and len(words) + len(sentence) > max_words:
+            chunks.append({'text': ' '.join(words), 'page': page})
+            words = []
+        while len(sentence) > max_words:  # Run-on text such as tables is cut at max_words
+            chunks.append({'text': ' '.join(sentence[:max_words]), 'page': sentence_page})
+            sentence = sentence[max_words:]
+        if not words:
+            page = sentence_page
+        words.extend(sentence)
+        if len(words) >= min_words:
+            chunks.append({'text': ' '.join(words), 'page': page})
+            words = []
+    if words:
+        chunks.append({'text': ' '.join(words), 'page': page})
+    return chunks
+
+def _sections_from_blocks(blocks, outline, max_chars=1000):
+    sections = []
+    for i, entry in enumerate(outline):
+        texts, pages = [], []
+        end = outline[i+1]['block'] if i+1 < len(outline) else len(blocks)
+        for block in blocks[entry['block']:end]:
+            texts.append(block.text)
+            pages.append(block.page)
+        size = 0
+        head = len(texts)
+        for k, text in enumerate(texts):
+            size += len(text) + 1
+            if size > max_chars:  # Enough text for the truncated output
+                head = k + 1
+                break
+        sections.append({
+            'title': entry['text'],
+            'refined_text': _refine(texts[:head]),
+            'page': entry['page'],
+            'level': entry['level'],
+            'chunks': chunk_text(texts, pages)
+        })
+    return sections
+
+def section_bodies(blocks, outline):
+    # Each blocks-path section's words joined by single spaces, which is what its chunks partition
+    texts = blocks.texts() if isinstance(blocks, BlockStore) else [b.text for b in blocks]
+    return [
+        ' '.join(' '.join(texts[entry['block']:outline[i+1]['block'] if i+1 < len(outline) else len(texts)]).split())
+        for i, entry in enumerate(outline)
+    ]
+
+def pack_sections(sections, with_body=True):
+    # Sub-chunks partition their section's words, so each is stored as a character range of the section
+    # body (its chunk texts joined by spaces) and the text is kept once. Without with_body the bodies are
+    # left out and unpack_sections needs them back, e.g. from section_bodies
+    records = []
+    chunks = {field: [] for field in CHUNK_FIELDS}
+    for i, section in enumerate(sections):
+        texts = [c['text'] for c in section.get('chunks', [])]
+        start = 0
+        for chunk, text in zip(section.get('chunks', []), texts):
+            chunks['section'].append(i)
+            chunks['start'].append(start)
+            chunks['end'].append(start + len(text))
+            chunks['page'].append(chunk['page'])
+            start += len(text) + 1
+        records.append({**section, 'body': ' '.join(texts)})
+    arrays = pack_records(records, SECTION_TEXT_FIELDS + (('body',) if with_body else ()), SECTION_INT_FIELDS)
+    arrays.update({'chunk_' + field: np.array(values, dtype=np.int64) for field, values in chunks.items()})
+    return arrays
+
+def unpack_sections(arrays, bodies=None):
+    text_fields = SECTION_TEXT_FIELDS + (('body',) if bodies is None else ())
+    sections = unpack_records(arrays, text_fields, SECTION_INT_FIELDS)
+    if bodies is None:
+        bodies = [section.pop('body') for section in sections]
+    for section in sections:
+        section['chunks'] = []
+    for i, start, end, page in zip(*(arrays['chunk_' + field].tolist() for field in CHUNK_FIELDS)):
+        sections[i]['chunks'].append({'text': bodies[i][start:end], 'page': page})
+    return sections
+
+@traced('extract_section_text')
+def extract_section_text(doc, outline, blocks=None):
+    # With blocks, sections are cut at the heading span itself in a single pass over the document
+    if blocks is not None:
+        return _sections_from_blocks(blocks, outline)
+    page_texts = {}
     sections = []
     for i, entry in enumerate(outline):
         start_page = entry['page'] - 1
         end_page = outline[i+1]['page'] - 1 if i+1 < len(outline) else len(doc) - 1
-        text = ''
+        for p in [p for p in page_texts if p < start_page]:
+            del page_texts[p]  # Outline is in page order, earlier pages are never revisited
+        parts = []
         for p in range(start_page, end_page + 1):
-            text += doc[p].get_text('text') + ' '
-        refined_text = ' '.join(text.strip().split())[:1000]  # Clean and truncate
+            if p not in page_texts:  # Parse each page once, however many sections span it
+                page_texts[p] = doc[p].get_text('text')
+            parts.append(page_texts[p])
         sections.append({
             'title': entry['text'],
-            'refined_text': refined_text,
+            'refined_text': _refine(parts),
             'page': entry['page'],
-            'level': entry['level']
+            'level': entry['level'],
+            'chunks': chunk_text(parts, list(range(start_page + 1, end_page + 2)))
         })
-    return sections
\ No newline at end of file
+    return sections
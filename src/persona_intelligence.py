@@ -1,134 +1,478 @@
 import json
 import os
 import datetime
-from rank_bm25 import BM25Okapi
 import re
-import nltk
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
-import torch
 import numpy as np
-from pdf_utils import load_pdf, extract_text_blocks, calculate_document_stats, build_outline, extract_section_text
-from multiprocess import Pool
+from parse_cache import CACHE_DIR, parse_pdf, file_key, has_entry
+from bm25_index import BM25Index, top_indices
+from chunk_index import top_chunks
+from score_cache import ScoreCache
+from json_writer import write_json, with_extension
+from shm_transport import export_arrays, import_arrays
+from tracing import traced, span, session, wrap_task, unwrap_result
+from deadline import (Deadline, activate, current, stage, page_cap, PARSE_SHARE, PARSE_SECONDS_PER_PAGE,
+                      RERANK_REDUCED_SECONDS, RERANK_MIN_SECONDS, EMBED_MIN_SECONDS)
+from pdf_utils import page_count, pack_sections, unpack_sections
+from multiprocess import Pool, TimeoutError as PoolTimeout
+import threading
 import traceback
 import time
 
-nltk.data.path.append('models/nltk_data')
+nltk_data_path = 'models/nltk_data'
 local_model_path = 'models/ms-marco-MiniLM-L-12-v2'
 
-if not os.path.exists(local_model_path):
-    raise FileNotFoundError(f"Local model path '{local_model_path}' does not exist. Run test_model.py to download it first.")
+# Cross-encoder backends (and torch/transformers with them) are loaded by load_model() on first use
+loaded_rerankers = {}
 
-tokenizer = AutoTokenizer.from_pretrained(local_model_path)
-model = AutoModelForSequenceClassification.from_pretrained(local_model_path)
+# Candidates sent to the cross-encoder, chosen by BM25 across the whole collection
+RERANK_TOP_K = int(os.environ.get('RERANK_TOP_K', 100))
+PARSE_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+# Cross-encoder batching: pairs are packed shortest first until pairs x longest-pair tokens reaches
+# RERANK_TOKEN_BUDGET (bounds peak memory); RERANK_BATCH_SIZE caps pairs per batch
+RERANK_TOKEN_BUDGET = int(os.environ.get('RERANK_TOKEN_BUDGET', 8192))
+RERANK_BATCH_SIZE = int(os.environ.get('RERANK_BATCH_SIZE', 16))
+RERANK_MAX_LENGTH = int(os.environ.get('RERANK_MAX_LENGTH', 512))
+RERANK_THREADS = int(os.environ.get('RERANK_THREADS', os.cpu_count() or 1))
+# One of rerankers.BACKENDS: torch, torch-int8, onnx
+RERANK_BACKEND = os.environ.get('RERANK_BACKEND', 'torch')
+# Set RERANK_CACHE_PATH to an empty string to keep rerank scores in memory only
+RERANK_CACHE_PATH = os.environ.get('RERANK_CACHE_PATH', '.cache/rerank_scores.sqlite')
+RERANK_CACHE_SIZE = int(os.environ.get('RERANK_CACHE_SIZE', 100000))
+
+# Cascade: rerank depth follows the BM25 score distribution. Every candidate within CASCADE_SCORE_RATIO
+# of the best BM25 score is kept (at least CASCADE_MIN_K, at most RERANK_TOP_K); 0 keeps all top-k
+CASCADE_SCORE_RATIO = float(os.environ.get('CASCADE_SCORE_RATIO', 0.4))
+CASCADE_MIN_K = int(os.environ.get('CASCADE_MIN_K', 20))
+# Candidates are cross-encoded in BM25-order chunks; stop once the top CASCADE_TOP_N has not changed
+# for CASCADE_PATIENCE chunks in a row (0 disables early exit)
+CASCADE_CHUNK = int(os.environ.get('CASCADE_CHUNK', 16))
+CASCADE_TOP_N = int(os.environ.get('CASCADE_TOP_N', 10))
+CASCADE_PATIENCE = int(os.environ.get('CASCADE_PATIENCE', 2))
+# Optional cheaper middle stage, e.g. models/ms-marco-MiniLM-L-6-v2: it scores every candidate and only
+# its best CASCADE_MIDDLE_KEEP go on to the main cross-encoder
+CASCADE_MIDDLE_MODEL = os.environ.get('CASCADE_MIDDLE_MODEL', '')
+CASCADE_MIDDLE_KEEP = int(os.environ.get('CASCADE_MIDDLE_KEEP', 30))
+# subsection_analysis entries per ranked section: its most query-similar 200-300 word sub-chunks
+SUBSECTION_CHUNKS = int(os.environ.get('SUBSECTION_CHUNKS', 1))
+
+score_caches = {}
+score_caches_lock = threading.Lock()
+
+def cache_for(model_path):
+    # Created on first use, so importing this module never touches the disk.
+    # Backends score slightly differently, so each (model, backend) gets its own cache keys
+    with score_caches_lock:
+        if model_path not in score_caches:
+            score_caches[model_path] = ScoreCache(f"{os.path.basename(model_path)}:{RERANK_BACKEND}",
+                                                  RERANK_CACHE_PATH, RERANK_CACHE_SIZE)
+        return score_caches[model_path]
+
+def rerank_batching():
+    return {'token_budget': RERANK_TOKEN_BUDGET, 'max_batch': RERANK_BATCH_SIZE, 'max_length': RERANK_MAX_LENGTH}
+
+def load_model(model_path=local_model_path):
+    if model_path in loaded_rerankers:
+        return loaded_rerankers[model_path]
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"Local model path '{model_path}' does not exist. Run test_model.py to download it first.")
+    from rerankers import get_reranker
+    loaded_rerankers[model_path] = get_reranker(RERANK_BACKEND, model_path, RERANK_THREADS, **rerank_batching())
+    return loaded_rerankers[model_path]
 
 def fallback_tokenize(text):
     return re.findall(r'\w+', text.lower())
 
-def compute_relevance(section_texts, job_task, persona_role):
-    try:
-        query = f"{persona_role} needs to: {job_task}"
-        filtered_texts = [text for text in section_texts if len(text.split()) >= 20]
-        if not filtered_texts:
-            return [0.0] * len(section_texts)
+def build_query(job_task, persona_role):
+    return f"{persona_role} needs to: {job_task}"
 
-        try:
-            from nltk.tokenize import word_tokenize
-            tokenized_texts = [word_tokenize(t.lower()) for t in filtered_texts]
-            query_tokens = word_tokenize(query.lower())
-        except LookupError:
+nltk_missing_reported = False
+
+def tokenize_for_bm25(texts, query):
+    global nltk_missing_reported
+    try:
+        import nltk
+        from nltk.tokenize import word_tokenize
+        if nltk_data_path not in nltk.data.path:
+            nltk.data.path.append(nltk_data_path)
+        return [word_tokenize(t.lower()) for t in texts], word_tokenize(query.lower())
+    except (ImportError, LookupError):
+        if not nltk_missing_reported:  # Documents are tokenized one at a time, so say it once
             print("NLTK 'punkt_tab' not found - using fallback tokenization.")
-            tokenized_texts = [fallback_tokenize(t) for t in filtered_texts]
-            query_tokens = fallback_tokenize(query)
-        
-        bm25 = BM25Okapi(tokenized_texts)
-        bm25_scores = bm25.get_scores(query_tokens)
-
-        top_indices = np.argsort(bm25_scores)[-50:][::-1]
-        top_texts = [filtered_texts[i] for i in top_indices]
-
-        pairs = [[query, text[:500]] for text in top_texts] 
-        inputs = tokenizer(pairs, padding=True, truncation=True, return_tensors="pt")
-        with torch.no_grad():
-            logits = model(**inputs).logits.squeeze().cpu().numpy()
-        rerank_scores = 1 / (1 + np.exp(-logits)) 
-
-        full_scores = [0.0] * len(filtered_texts)
-        for idx, score in zip(top_indices, rerank_scores):
-            full_scores[idx] = score
-        original_scores = [0.0] * len(section_texts)
-        filtered_idx = 0
-        for i, text in enumerate(section_texts):
-            if len(text.split()) >= 20:
-                original_scores[i] = full_scores[filtered_idx]
-                filtered_idx += 1
-
-        hybrid_scores = []
-        for score, text in zip(original_scores, section_texts):
-            length = len(text.split())
-            length_penalty = 1.0 if 50 <= length <= 500 else 0.8
-            hybrid_scores.append(score * length_penalty)
-
-        max_score = max(hybrid_scores) if hybrid_scores and max(hybrid_scores) > 0 else 1.0
-        normalized_scores = [s / max_score for s in hybrid_scores]
-
-        avg_score = np.mean(normalized_scores)
-        print(f"Avg relevance score (BM25 + Rerank): {avg_score:.2f}")
-        
-        return normalized_scores
+            nltk_missing_reported = True
+        return [fallback_tokenize(t) for t in texts], fallback_tokenize(query)
+
+@traced('select_candidates')
+def select_candidates_batch(section_texts, queries, top_k=RERANK_TOP_K, tokenized_texts=None):
+    # One (candidates, BM25 scores) pair per query: indices into section_texts of its BM25 top-k, best first.
+    # Every query is scored against the same index in one sparse product; pass tokenized_texts (one token
+    # list per section) to skip tokenization
+    filtered_idx = [i for i, text in enumerate(section_texts) if len(text.split()) >= 20]
+    if not filtered_idx:
+        return [([], np.zeros(0)) for _ in queries]
+    if tokenized_texts is None:
+        tokenized_texts, _ = tokenize_for_bm25([section_texts[i] for i in filtered_idx], '')
+    else:
+        tokenized_texts = [tokenized_texts[i] for i in filtered_idx]
+    query_tokens, _ = tokenize_for_bm25(queries, '')
+    selected = []
+    for bm25_scores in BM25Index(tokenized_texts).get_scores_batch(query_tokens):
+        top = top_indices(bm25_scores, top_k)
+        depth = adaptive_depth(bm25_scores[top])
+        selected.append(([filtered_idx[i] for i in top[:depth]], bm25_scores[top[:depth]]))
+    return selected
+
+def select_candidates(section_texts, query, top_k=RERANK_TOP_K, tokenized_texts=None):
+    # Returns indices into section_texts of the BM25 top-k, best first; pass tokenized_texts (one token
+    # list per section) to skip tokenization
+    return select_candidates_batch(section_texts, [query], top_k, tokenized_texts)[0][0]
+
+def adaptive_depth(sorted_scores, ratio=CASCADE_SCORE_RATIO, min_k=CASCADE_MIN_K):
+    # A few clear lexical winners need a shallow rerank; a flat head (hard query) needs a deep one
+    if len(sorted_scores) == 0 or ratio <= 0 or sorted_scores[0] <= 0:
+        return len(sorted_scores)
+    depth = int(np.sum(sorted_scores >= ratio * sorted_scores[0]))
+    return max(depth, min(min_k, len(sorted_scores)))
+
+def _run_model(pairs, model_path=local_model_path):
+    reranker = load_model(model_path)
+    # The backend tokenizes once and packs token-budgeted, length-sorted batches
+    logits = reranker.predict_logits([[query, t] for query, t in pairs])
+    return 1 / (1 + np.exp(-logits))
+
+def rerank_pair_batch(pairs, model_path=local_model_path):
+    # Scores (query, text) pairs that may span several queries in one model call
+    scores = np.zeros(len(pairs))
+    if not pairs:
+        return scores
+    cache = cache_for(model_path)
+    pairs = [(query, t[:500]) for query, t in pairs]
+    keys = [cache.key(query, t) for query, t in pairs]
+    cached = cache.get_many(keys)
+    # Only cache misses reach the model; duplicate pairs within the batch are scored once
+    misses = {k: pair for k, pair in zip(keys, pairs) if k not in cached}
+    if misses:
+        miss_keys = list(misses)
+        miss_scores = _run_model(list(misses.values()), model_path)
+        new_items = [(k, float(v)) for k, v in zip(miss_keys, miss_scores)]
+        cache.put_many(new_items)
+        cached.update(new_items)
+    for i, key in enumerate(keys):
+        scores[i] = cached[key]
+    return scores
+
+@traced('cascade_rerank')
+def cascade_rerank_batch(queries, text_lists):
+    # text_lists[q] holds query q's candidates, best BM25 first; candidates the cascade never reaches keep a
+    # score of 0. Queries advance chunk by chunk in lockstep so each step is one model call for all of them
+    scores = [np.zeros(len(texts)) for texts in text_lists]
+    orders = [list(range(len(texts))) for texts in text_lists]
+    middle = [q for q, texts in enumerate(text_lists) if CASCADE_MIDDLE_MODEL and len(texts) > CASCADE_MIDDLE_KEEP]
+    if middle:
+        middle_scores = rerank_pair_batch([(queries[q], t) for q in middle for t in text_lists[q]],
+                                          model_path=CASCADE_MIDDLE_MODEL)
+        offset = 0
+        for q in middle:
+            query_scores = middle_scores[offset:offset + len(text_lists[q])]
+            offset += len(text_lists[q])
+            orders[q] = [int(i) for i in np.argsort(-query_scores, kind='stable')[:CASCADE_MIDDLE_KEEP]]
+    previous_top = [None] * len(queries)
+    stable_chunks = [0] * len(queries)
+    active = list(range(len(queries)))
+    deadline = current()
+    chunk_seconds = 0.0
+    for start in range(0, max((len(order) for order in orders), default=0), CASCADE_CHUNK):
+        active = [q for q in active if start < len(orders[q])]
+        if not active:
+            break
+        if deadline and start and deadline.remaining() < chunk_seconds:
+            deadline.degrade('rank', 'rerank_truncated', f"{start} of {max(len(orders[q]) for q in active)} candidates")
+            break
+        chunks = [orders[q][start:start + CASCADE_CHUNK] for q in active]
+        chunk_start = time.monotonic()
+        chunk_scores = rerank_pair_batch([(queries[q], text_lists[q][i]) for q, chunk in zip(active, chunks) for i in chunk])
+        chunk_seconds = time.monotonic() - chunk_start
+        offset = 0
+        still_active = []
+        for q, chunk in zip(active, chunks):
+            scores[q][chunk] = chunk_scores[offset:offset + len(chunk)]
+            offset += len(chunk)
+            scored = orders[q][:start + CASCADE_CHUNK]
+            top = set(sorted(scored, key=lambda i: -scores[q][i])[:CASCADE_TOP_N])
+            stable_chunks[q] = stable_chunks[q] + 1 if top == previous_top[q] else 0
+            previous_top[q] = top
+            if CASCADE_PATIENCE and stable_chunks[q] >= CASCADE_PATIENCE and len(scored) < len(orders[q]):
+                print(f"Rerank early exit: top {CASCADE_TOP_N} stable after {len(scored)} of {len(orders[q])} candidates")
+            else:
+                still_active.append(q)
+        active = still_active
+    return scores
+
+def cascade_rerank(query, texts):
+    # texts arrive best BM25 first; candidates the cascade never reaches keep a score of 0
+    return cascade_rerank_batch([query], [texts])[0]
+
+def combine_scores(section_texts, candidates, rerank_scores):
+    original_scores = [0.0] * len(section_texts)
+    for idx, score in zip(candidates, rerank_scores):
+        original_scores[idx] = float(score)
+
+    hybrid_scores = []
+    for score, text in zip(original_scores, section_texts):
+        length = len(text.split())
+        length_penalty = 1.0 if 50 <= length <= 500 else 0.8
+        hybrid_scores.append(score * length_penalty)
+
+    max_score = max(hybrid_scores) if hybrid_scores and max(hybrid_scores) > 0 else 1.0
+    normalized_scores = [s / max_score for s in hybrid_scores]
+
+    avg_score = np.mean(normalized_scores) if normalized_scores else 0.0
+    print(f"Avg relevance score (BM25 + Rerank): {avg_score:.2f}")
+    return normalized_scores
+
+@traced('compute_relevance')
+def compute_relevance_batch(section_texts, queries, tokenized_texts=None):
+    # One score list per query over the same sections
+    try:
+        deadline = current()
+        remaining = deadline.remaining() if deadline else float('inf')
+        top_k = RERANK_TOP_K
+        if RERANK_MIN_SECONDS <= remaining < RERANK_REDUCED_SECONDS:
+            top_k = max(CASCADE_MIN_K, RERANK_TOP_K // 2)
+        selected = select_candidates_batch(section_texts, queries, top_k, tokenized_texts)
+        n_candidates = sum(len(candidates) for candidates, _ in selected)
+        if not n_candidates:
+            return [[0.0] * len(section_texts) for _ in queries]
+        if remaining < RERANK_MIN_SECONDS:
+            # No time for the cross-encoder: BM25 scores scaled to the rerank range stand in for it
+            deadline.degrade('rank', 'bm25_only', f"{n_candidates} candidates by BM25, {remaining:.1f}s left")
+            rerank_scores = [bm25_scores / max(float(bm25_scores[0]), 1e-9) if len(bm25_scores) else bm25_scores
+                             for _, bm25_scores in selected]
+        else:
+            candidate_texts = [[section_texts[i] for i in candidates] for candidates, _ in selected]
+            if top_k != RERANK_TOP_K:
+                candidate_texts = [[t[:250] for t in texts] for texts in candidate_texts]
+                deadline.degrade('rank', 'reduced_rerank', f"top {top_k} candidates, 250-char texts, {remaining:.1f}s left")
+            rerank_scores = cascade_rerank_batch(queries, candidate_texts)
+        return [combine_scores(section_texts, candidates, scores) if candidates else [0.0] * len(section_texts)
+                for (candidates, _), scores in zip(selected, rerank_scores)]
     except Exception as e:
         print(f"Relevance error: {e}")
-        return [0.0] * len(section_texts)
+        return [[0.0] * len(section_texts) for _ in queries]
 
-def process_single_doc(args):
-    doc_info, input_dir, job_task, persona_role = args
+def compute_collection_relevance_batch(doc_section_texts, queries, doc_tokens=None):
+    # One BM25 index over every section in the collection, so IDF and scores are comparable across
+    # documents; each query's global top-k then goes to the shared reranker. Returns, per query, one
+    # score list per document
+    flat_texts = [text for section_texts in doc_section_texts for text in section_texts]
+    flat_tokens = [tokens for section_tokens in doc_tokens for tokens in section_tokens] if doc_tokens else None
+    query_scores = []
+    for flat_scores in compute_relevance_batch(flat_texts, queries, flat_tokens):
+        all_scores = []
+        offset = 0
+        for section_texts in doc_section_texts:
+            all_scores.append(flat_scores[offset:offset + len(section_texts)])
+            offset += len(section_texts)
+        query_scores.append(all_scores)
+    return query_scores
+
+def parse_single_doc(args, max_pages=None):
+    doc_info, input_dir = args
     doc_name = doc_info['filename']
     try:
         pdf_path = os.path.join(input_dir, doc_name)
-        doc = load_pdf(pdf_path)
-        blocks = extract_text_blocks(doc)
-        stats = calculate_document_stats(blocks)
-        outline = build_outline(blocks, stats)
-        sections = extract_section_text(doc, outline)
-        section_texts = [s['refined_text'][:500] for s in sections]
-        scores = compute_relevance(section_texts, job_task, persona_role)
-        for i, section in enumerate(sections):
+        _, _, sections = parse_pdf(pdf_path, max_pages=max_pages)  # Skips PyMuPDF for unchanged files
+        for section in sections:
             section['doc'] = doc_name
-            section['importance_rank'] = scores[i]
-            section['page'] = section['page']
-        doc.close()
         return sections
     except Exception as e:
         print(f"Error processing {doc_name}: {str(e)} - {traceback.format_exc()}")
         return []
 
-def process_collection(input_dir, output_dir):
-    start_time = time.time()
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-    config_path = os.path.join(input_dir, 'config.json')
-    with open(config_path, 'r', encoding='utf-8') as f:
-        config = json.load(f)
-    
+def parse_doc_shared(args):
+    # Pool task: only (index, shared-memory handle) goes back through the pipe
+    i, doc_info, input_dir, max_pages, stop_at = args
+    sections = parse_single_doc((doc_info, input_dir), max_pages)
+    if stop_at is not None and time.monotonic() > stop_at:
+        return i, None  # Too late to be used; don't leave a segment nobody will unlink
+    return i, export_arrays(pack_sections(sections))
+
+def _release_late(results):
+    # Frees the shared memory of documents that finished after their results were abandoned
+    for result in results:
+        try:
+            handle = unwrap_result(result)[1]
+            if handle is not None:
+                import_arrays(handle)
+        except Exception:
+            pass
+
+def iter_parsed_documents(documents, input_dir, pool, max_pages=None, stop_at=None):
+    # Submits every document now and yields (index into documents, sections) as each one finishes.
+    # At stop_at (a time.monotonic() value) documents still parsing are abandoned and the iterator ends;
+    # workers finishing after it send no arrays back
+    tasks = [(i, d, input_dir, max_pages, stop_at) for i, d in enumerate(documents)]
+    results = pool.imap_unordered(wrap_task(parse_doc_shared), tasks)
+    def consume():
+        with span('parse_documents', tasks=len(tasks)):
+            for _ in tasks:
+                try:
+                    i, handle = unwrap_result(results.next(None if stop_at is None else max(0.0, stop_at - time.monotonic())))
+                except PoolTimeout:
+                    threading.Thread(target=_release_late, args=(results,), daemon=True).start()
+                    return
+                if handle is not None:
+                    sections = unpack_sections(import_arrays(handle))
+                    for section in sections:
+                        section['doc'] = documents[i]['filename']
+                    yield i, sections
+    return consume()
+
+def parse_page_cap(documents, input_dir, workers, deadline):
+    # Caps pages per document when the collection would not parse within its share of the budget.
+    # Cached documents come back whole without PyMuPDF, so they neither count nor get opened here
+    pages = []
+    for d in documents:
+        pdf_path = os.path.join(input_dir, d['filename'])
+        try:
+            pages.append(0 if CACHE_DIR and has_entry(file_key(pdf_path)) else page_count(pdf_path))
+        except Exception:
+            pages.append(0)
+    allowed = max(0.0, deadline.at(PARSE_SHARE) - time.monotonic()) * workers / PARSE_SECONDS_PER_PAGE
+    cap = page_cap(pages, allowed)
+    if cap is not None:
+        deadline.degrade('parse', 'page_cap', f"first {cap} pages of {sum(p > cap for p in pages)} long documents")
+    return cap
+
+def parse_collection(documents, input_dir, pool, deadline=None):
+    # Parses every document once and returns (sections, BM25 tokens) per document in config order.
+    # Section tokens do not depend on the query, so one parse serves any number of queries
+    results = [None] * len(documents)
+    doc_tokens = [None] * len(documents)
+    with stage('parse'):
+        max_pages, stop_at = None, None
+        if deadline:
+            max_pages = parse_page_cap(documents, input_dir, getattr(pool, '_processes', PARSE_WORKERS), deadline)
+            stop_at = deadline.at(PARSE_SHARE)
+        parsed = iter_parsed_documents(documents, input_dir, pool, max_pages, stop_at)
+        try:
+            load_model()  # Overlaps with parsing; a missing model is reported when scoring falls back
+        except Exception:
+            pass
+        for i, sections in parsed:  # Tokenize early documents while the slowest ones are still parsing
+            results[i] = sections
+            doc_tokens[i], _ = tokenize_for_bm25([s['refined_text'][:500] for s in sections], '')
+        skipped = [d['filename'] for d, sections in zip(documents, results) if sections is None]
+        if skipped:
+            deadline.degrade('parse', 'skipped_documents', ', '.join(skipped))
+            for i, sections in enumerate(results):
+                if sections is None:
+                    results[i], doc_tokens[i] = [], []
+    return results, doc_tokens
+
+def query_configs(config):
+    # A config may list several {"persona", "job_to_be_done", optional "query_id"} entries under "queries";
+    # each becomes its own config over the same documents, with the query id appended to the challenge id.
+    # A config without "queries" is a batch of one
+    if not config.get('queries'):
+        return [config]
+    base = {k: v for k, v in config.items() if k != 'queries'}
     challenge_id = config['challenge_info']['challenge_id']
+    return [
+        {
+            **base,
+            'challenge_info': {**config['challenge_info'], 'challenge_id': f"{challenge_id}_{q.get('query_id', i + 1)}"},
+            'persona': q['persona'],
+            'job_to_be_done': q['job_to_be_done']
+        }
+        for i, q in enumerate(config['queries'])
+    ]
+
+def run_batch(config, input_dir, pool=None, deadline=None):
+    # Parses and indexes the collection once, ranks it for every query in query_configs(config) and returns
+    # (query config, output dict) pairs; pass a live pool to reuse its workers.
+    # Workers only parse; scoring happens here so the cross-encoder is loaded and run once.
+    # With a Deadline (one budget for the whole batch), every stage trims its work to fit and the output
+    # metadata lists what was cut
+    if pool is None:
+        with Pool(processes=PARSE_WORKERS) as pool:
+            return run_batch(config, input_dir, pool, deadline)
+    with activate(deadline):
+        results, doc_tokens = parse_collection(config['documents'], input_dir, pool, deadline)
+        with stage('rank'):
+            configs = query_configs(config)
+            return list(zip(configs, rank_batch(configs, results, doc_tokens)))
+
+def run_collection(config, input_dir, pool=None, deadline=None):
+    # Parses, scores and ranks one collection for its single persona/job and returns the output dict
+    config = {k: v for k, v in config.items() if k != 'queries'}
+    return run_batch(config, input_dir, pool, deadline)[0][1]
+
+def rank_batch(configs, results, doc_tokens=None):
+    # results holds each document's sections in config order; configs share the documents and differ in
+    # persona/job. BM25 and the rerank cascade run for all queries together
+    doc_section_texts = [[s['refined_text'][:500] for s in sections] for sections in results]
+    queries = [build_query(c['job_to_be_done']['task'], c['persona']['role']) for c in configs]
+    query_scores = compute_collection_relevance_batch(doc_section_texts, queries, doc_tokens)
+    # build_output overwrites importance_rank on the shared sections, so outputs are built one at a time
+    return [build_output(c, results, doc_scores) for c, doc_scores in zip(configs, query_scores)]
+
+def rank_collection(config, results, doc_tokens=None):
+    return rank_batch([config], results, doc_tokens)[0]
+
+def select_subsections(query, sections, per_section=SUBSECTION_CHUNKS):
+    # Sections without sub-chunks (e.g. from older incremental state files) fall back to their refined_text
+    texts, pages, groups = [], [], []
+    for i, sec in enumerate(sections):
+        for chunk in sec.get('chunks') or [{'text': sec['refined_text'], 'page': sec['page']}]:
+            texts.append(chunk['text'])
+            pages.append(chunk['page'])
+            groups.append(i)
+    first_chunks = [k for k, g in enumerate(groups) if k == 0 or groups[k - 1] != g]
+    deadline = current()
+    if deadline and deadline.remaining() < EMBED_MIN_SECONDS:
+        deadline.degrade('output', 'subsections_unranked', f"first sub-chunk of {len(sections)} sections")
+        selected = first_chunks
+    else:
+        try:
+            selected = top_chunks(query, texts, groups, per_section)
+        except Exception as e:
+            print(f"Sub-chunk ranking error: {e}")
+            selected = first_chunks
+    return [
+        {
+            "document": sections[groups[k]]['doc'],
+            "refined_text": texts[k],
+            "page_number": pages[k]
+        }
+        for k in selected
+    ]
+
+def build_output(config, results, doc_scores):
     documents = config['documents']
     persona_role = config['persona']['role']
     job_task = config['job_to_be_done']['task']
     timestamp = datetime.datetime.now().isoformat().replace(':', '-') 
-    with Pool(processes=os.cpu_count() // 2) as pool:
-        results = pool.map(process_single_doc, [(d, input_dir, job_task, persona_role) for d in documents])
+    for sections, scores in zip(results, doc_scores):
+        for section, score in zip(sections, scores):
+            section['importance_rank'] = score
     all_sections = [item for sublist in results for item in sublist if item['importance_rank'] >= 0.45]
     
     all_sections.sort(key=lambda x: (-x['importance_rank'], x['page']))
     for i, sec in enumerate(all_sections):
         sec['importance_rank'] = i + 1
     
-    output_data = {
-        "metadata": {
-            "input_documents": [d['filename'] for d in documents],
-            "persona": persona_role,
-            "job_to_be_done": job_task,
-            "processing_timestamp": timestamp
-        },
+    subsections = select_subsections(build_query(job_task, persona_role), all_sections)
+    metadata = {
+        "input_documents": [d['filename'] for d in documents],
+        "persona": persona_role,
+        "job_to_be_done": job_task,
+        "processing_timestamp": timestamp
+    }
+    deadline = current()
+    if deadline and deadline.degradations:
+        metadata["degradations"] = list(deadline.degradations)
+    return {
+        "metadata": metadata,
         "extracted_sections": [
             {
                 "document": sec['doc'],
@@ -138,20 +482,49 @@ def process_collection(input_dir, output_dir):
             }
             for sec in all_sections
         ],
-        "subsection_analysis": [
-            {
-                "document": sec['doc'],
-                "refined_text": sec['refined_text'],
-                "page_number": sec['page']
-            }
-            for sec in all_sections
-        ]
+        "subsection_analysis": subsections
     }
-    
-    output_filename = os.path.join(output_dir, f"results_{challenge_id}_{timestamp}.json")
-    with open(output_filename, 'w', encoding='utf-8') as f:
-        json.dump(output_data, f, indent=4, ensure_ascii=False)
-    print(f"Output saved to {output_filename}")
+
+def write_output_data(path, output_data):
+    # Sections are streamed one at a time in the OUTPUT_FORMAT layout (pretty JSON by default)
+    write_json(path, {'metadata': output_data['metadata']}, [
+        ('extracted_sections', output_data['extracted_sections']),
+        ('subsection_analysis', output_data['subsection_analysis'])
+    ])
+
+@traced('write_output')
+def write_collection_output(output_data, config, output_dir):
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    challenge_id = config['challenge_info']['challenge_id']
+    timestamp = output_data['metadata']['processing_timestamp']
+    output_filename = with_extension(os.path.join(output_dir, f"results_{challenge_id}_{timestamp}"))
+    write_output_data(output_filename, output_data)
+    return output_filename
+
+def process_collection(input_dir, output_dir):
+    start_time = time.time()
+    config_path = os.path.join(input_dir, 'config.json')
+    with open(config_path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    deadline = Deadline()
+    with session('process_collection'):
+        try:
+            ranked = run_batch(config, input_dir, deadline=deadline)
+        except Exception as e:
+            # Still answer within the SLA: an empty ranking that says why
+            print(f"Collection error: {e} - {traceback.format_exc()}")
+            deadline.degrade('pipeline', 'empty_result', str(e))
+            empty = [[] for _ in config['documents']]
+            with activate(deadline):
+                ranked = [(c, build_output(c, empty, empty)) for c in query_configs(config)]
+        with deadline.stage('output'):
+            output_filenames = [write_collection_output(output_data, c, output_dir) for c, output_data in ranked]
+    for output_filename in output_filenames:
+        print(f"Output saved to {output_filename}")
+    print(f"Stage times: {deadline.summary()}")
+    cache_stats = cache_for(local_model_path).stats()
+    print(f"Rerank cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses ({cache_stats['hit_rate']:.0%} hit rate)")
     print(f"Processing time: {time.time() - start_time} seconds")
 
 if __name__ == '__main__':
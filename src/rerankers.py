@@ -0,0 +1,131 @@
+# src/rerankers.py
+# Cross-encoder backends. Each one takes any number of [query, text] pairs and returns raw logits,
+# so callers can swap speed for accuracy per deployment via RERANK_BACKEND:
+#   torch      - fp32 PyTorch model (reference)
+#   torch-int8 - the same model with Linear layers dynamically quantized to int8
+#   onnx       - ONNX Runtime session over an offline export (python src/rerankers.py export-onnx)
+import os
+import sys
+import numpy as np
+
+ONNX_SUBDIR = 'onnx'
+
+def token_budget_batches(lengths, token_budget, max_batch):
+    # Packs pair indices, shortest first, into batches whose padded size (pairs x longest) fits the budget.
+    # A pair longer than the budget on its own still gets a batch of one.
+    batches = []
+    current = []
+    for i in np.argsort(lengths, kind='stable'):
+        longest = lengths[i]  # Ascending order, so the newest pair is the longest in the batch
+        if current and ((len(current) + 1) * longest > token_budget or len(current) >= max_batch):
+            batches.append(current)
+            current = []
+        current.append(int(i))
+    if current:
+        batches.append(current)
+    return batches
+
+class BatchedReranker:
+    # Tokenizes every pair once without padding, then pads and runs one token-budgeted batch at a time.
+    # token_budget bounds activation memory; max_batch and the thread count trade latency for throughput.
+    tensor_type = None
+
+    def __init__(self, token_budget=8192, max_batch=16, max_length=512):
+        self.token_budget = token_budget
+        self.max_batch = max_batch
+        self.max_length = max_length
+
+    def forward(self, inputs):
+        raise NotImplementedError
+
+    def predict_logits(self, pairs):
+        logits = np.zeros(len(pairs))
+        if not pairs:
+            return logits
+        encoded = self.tokenizer(pairs, truncation=True, max_length=self.max_length)
+        rows = [{name: encoded[name][i] for name in encoded.keys()} for i in range(len(pairs))]
+        lengths = [len(row['input_ids']) for row in rows]
+        for batch in token_budget_batches(lengths, self.token_budget, self.max_batch):
+            inputs = self.tokenizer.pad([rows[i] for i in batch], return_tensors=self.tensor_type)
+            logits[batch] = self.forward(inputs)
+        return logits
+
+class TorchReranker(BatchedReranker):
+    name = 'torch'
+    tensor_type = 'pt'
+
+    def __init__(self, model_path, threads, **batching):
+        super().__init__(**batching)
+        import torch
+        from transformers import AutoTokenizer, AutoModelForSequenceClassification
+        self.torch = torch
+        torch.set_num_threads(threads)
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path)
+        self.model = AutoModelForSequenceClassification.from_pretrained(model_path).eval()
+
+    def forward(self, inputs):
+        with self.torch.no_grad():
+            return self.model(**inputs).logits.reshape(-1).cpu().numpy()
+
+class QuantizedTorchReranker(TorchReranker):
+    name = 'torch-int8'
+
+    def __init__(self, model_path, threads, **batching):
+        super().__init__(model_path, threads, **batching)
+        self.model = self.torch.quantization.quantize_dynamic(self.model, {self.torch.nn.Linear}, dtype=self.torch.qint8)
+
+class OnnxReranker(BatchedReranker):
+    name = 'onnx'
+    tensor_type = 'np'
+
+    def __init__(self, model_path, threads, **batching):
+        super().__init__(**batching)
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise ImportError("RERANK_BACKEND=onnx needs onnxruntime (pip install onnxruntime).")
+        from transformers import AutoTokenizer
+        onnx_path = os.path.join(model_path, ONNX_SUBDIR, 'model.onnx')
+        if not os.path.exists(onnx_path):
+            raise FileNotFoundError(f"ONNX model '{onnx_path}' does not exist. Run 'python src/rerankers.py export-onnx' first.")
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(onnx_path, options, providers=['CPUExecutionProvider'])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path)
+
+    def forward(self, inputs):
+        feed = {name: inputs[name].astype(np.int64) for name in self.input_names}
+        return self.session.run(None, feed)[0].reshape(-1)
+
+BACKENDS = {cls.name: cls for cls in (TorchReranker, QuantizedTorchReranker, OnnxReranker)}
+
+def get_reranker(name, model_path, threads, **batching):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown reranker backend '{name}', choose one of {sorted(BACKENDS)}")
+    return BACKENDS[name](model_path, threads, **batching)
+
+def export_onnx(model_path):
+    # Offline step (build time): writes <model_path>/onnx/model.onnx with dynamic batch and sequence axes
+    import torch
+    from transformers import AutoTokenizer, AutoModelForSequenceClassification
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    model = AutoModelForSequenceClassification.from_pretrained(model_path).eval()
+    sample = tokenizer([["query", "text"]], padding=True, truncation=True, return_tensors="pt")
+    names = [n for n in ('input_ids', 'attention_mask', 'token_type_ids') if n in sample]
+    output_dir = os.path.join(model_path, ONNX_SUBDIR)
+    os.makedirs(output_dir, exist_ok=True)
+    output_path = os.path.join(output_dir, 'model.onnx')
+    torch.onnx.export(
+        model, tuple(sample[n] for n in names), output_path,
+        input_names=names, output_names=['logits'],
+        dynamic_axes={**{n: {0: 'batch', 1: 'sequence'} for n in names}, 'logits': {0: 'batch'}},
+        opset_version=14
+    )
+    print(f"ONNX model saved to {output_path}")
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] != 'export-onnx':
+        print("Usage: python src/rerankers.py export-onnx [model_path]")
+        sys.exit(1)
+    export_onnx(sys.argv[2] if len(sys.argv) > 2 else 'models/ms-marco-MiniLM-L-12-v2')
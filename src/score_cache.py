@@ -0,0 +1,92 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+class ScoreCache:
+    # In-memory LRU in front of an sqlite table of (pair hash -> score); path=None keeps it memory only
+    def __init__(self, model_id, path=None, max_entries=100000):
+        self.model_id = model_id
+        self.max_entries = max_entries
+        self.memory = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.db = None
+        self.lock = threading.Lock()  # Scoring may run on service executor threads
+        if path:
+            try:
+                os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+                self.db = sqlite3.connect(path, check_same_thread=False)
+                self.db.execute('CREATE TABLE IF NOT EXISTS scores (key TEXT PRIMARY KEY, score REAL)')
+            except (OSError, sqlite3.Error) as e:
+                print(f"Rerank score cache kept in memory only: {e}")
+                self.db = None
+
+    def key(self, query, text):
+        return hashlib.sha256('\0'.join([self.model_id, query, text]).encode('utf-8')).hexdigest()
+
+    def _remember(self, key, score):
+        self.memory[key] = score
+        self.memory.move_to_end(key)
+        if len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    def get_many(self, keys):
+        # Returns {key: score} for every key found in memory or on disk
+        with self.lock:
+            return self._get_many(keys)
+
+    def _get_many(self, keys):
+        found = {}
+        missing = []
+        for key in keys:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                found[key] = self.memory[key]
+            else:
+                missing.append(key)
+        if self.db is not None and missing:
+            for start in range(0, len(missing), 500):  # Stay under sqlite's bound-parameter limit
+                chunk = missing[start:start + 500]
+                rows = self.db.execute(
+                    f"SELECT key, score FROM scores WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                for key, score in rows:
+                    found[key] = score
+                    self._remember(key, score)
+        # A pair repeated within one call is looked up, and scored, once
+        unique = set(keys)
+        unique_hits = sum(1 for key in unique if key in found)
+        self.hits += unique_hits
+        self.misses += len(unique) - unique_hits
+        return found
+
+    def put_many(self, items):
+        with self.lock:
+            self._put_many(items)
+
+    def _put_many(self, items):
+        for key, score in items:
+            self._remember(key, score)
+        if self.db is not None and items:
+            with self.db:
+                self.db.executemany('INSERT OR REPLACE INTO scores VALUES (?, ?)', items)
+
+    def seed(self, items):
+        # Loads known scores into memory only: no disk write, no hit/miss accounting
+        with self.lock:
+            for key, score in items:
+                self._remember(key, score)
+
+    def peek(self, keys):
+        # Scores currently held in memory for keys, without touching LRU order or stats
+        with self.lock:
+            return {key: self.memory[key] for key in keys if key in self.memory}
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hit_rate()}
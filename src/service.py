@@ -0,0 +1,211 @@
+# src/service.py
+# Long-running local service that keeps the cross-encoder and a parse worker pool warm between collection jobs.
+# Serve:  python src/service.py serve [--host 127.0.0.1] [--port 8765] [--socket /tmp/persona.sock]
+# Submit: python src/service.py submit input/ [--output-dir output/] [--port 8765] [--socket /tmp/persona.sock]
+#
+# POST /collection  {"config": <config.json contents>, "input_dir": "...", "output_dir": optional,
+#                    "deadline_seconds": optional SLA override}
+#                   -> the JSON process_collection writes (also saved to output_dir when given)
+# GET  /health      -> {"status": "ok", "active": n, "queued": n}
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from multiprocess import Pool
+from tracing import session
+from persona_intelligence import run_collection, write_collection_output, load_model, PARSE_WORKERS
+from deadline import Deadline, SLA_SECONDS
+
+# Jobs scored at the same time; more than one mostly makes torch threads compete
+SERVICE_CONCURRENCY = int(os.environ.get('SERVICE_CONCURRENCY', 1))
+# Jobs allowed to wait for a slot before new ones are rejected with 503
+SERVICE_QUEUE_LIMIT = int(os.environ.get('SERVICE_QUEUE_LIMIT', 16))
+MAX_BODY_BYTES = 16 * 1024 * 1024
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 413: 'Payload Too Large',
+           500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+class BadRequest(Exception):
+    # Malformed HTTP framing; answered with 400
+    pass
+
+async def read_request(reader):
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    parts = request_line.decode('latin-1').split()
+    if len(parts) != 3 or not parts[2].startswith('HTTP/'):
+        raise BadRequest(f"malformed request line {request_line[:100]!r}")
+    method, path, _ = parts
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, sep, value = line.decode('latin-1').partition(':')
+        if not sep:
+            raise BadRequest(f"malformed header line {line[:100]!r}")
+        headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get('content-length', 0))
+    except ValueError:
+        length = -1
+    if length < 0:
+        raise BadRequest(f"invalid Content-Length {headers['content-length'][:100]!r}")
+    if length > MAX_BODY_BYTES:
+        return method, path, None
+    try:
+        body = await reader.readexactly(length) if length else b''
+    except asyncio.IncompleteReadError:
+        raise BadRequest("body shorter than Content-Length")
+    return method, path, body
+
+def write_response(writer, status, payload):
+    body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    head = (f"HTTP/1.1 {status} {REASONS[status]}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n")
+    writer.write(head.encode('latin-1') + body)
+
+class CollectionService:
+    def __init__(self):
+        # Fork the parse workers before the model is loaded so they don't inherit its memory
+        self.pool = Pool(processes=PARSE_WORKERS)
+        self.executor = ThreadPoolExecutor(max_workers=SERVICE_CONCURRENCY)
+        self.slots = asyncio.Semaphore(SERVICE_CONCURRENCY)
+        self.active = 0
+        self.queued = 0
+        try:
+            load_model()
+        except Exception as e:
+            print(f"Reranker not loaded, jobs will fall back to zero scores: {e}")
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        self.pool.terminate()
+
+    async def run_job(self, payload):
+        config = payload['config']
+        input_dir = payload['input_dir']
+        # The SLA clock starts on arrival, so time spent queued comes out of the job's budget
+        deadline = Deadline(float(payload.get('deadline_seconds', SLA_SECONDS)))
+        for key in ('challenge_info', 'documents', 'persona', 'job_to_be_done'):
+            if key not in config:
+                return 400, {"error": f"config is missing '{key}'"}
+        if self.queued >= SERVICE_QUEUE_LIMIT:
+            return 503, {"error": "job queue is full"}
+        self.queued += 1
+        try:
+            await self.slots.acquire()
+        finally:
+            self.queued -= 1
+        self.active += 1
+        try:
+            start_time = time.time()
+            loop = asyncio.get_running_loop()
+            output_data = await loop.run_in_executor(self.executor, run_collection, config, input_dir, self.pool, deadline)
+            if payload.get('output_dir'):
+                output_filename = write_collection_output(output_data, config, payload['output_dir'])
+                print(f"Output saved to {output_filename}")
+            print(f"Processing time: {time.time() - start_time} seconds")
+            return 200, output_data
+        finally:
+            self.active -= 1
+            self.slots.release()
+
+    async def handle(self, reader, writer):
+        try:
+            request = await read_request(reader)
+            if request is None:
+                return
+            method, path, body = request
+            if body is None:
+                status, payload = 413, {"error": "request body too large"}
+            elif method == 'GET' and path == '/health':
+                status, payload = 200, {"status": "ok", "active": self.active, "queued": self.queued}
+            elif method == 'POST' and path == '/collection':
+                try:
+                    job = json.loads(body)
+                    status, payload = await self.run_job(job)
+                except (ValueError, KeyError, TypeError) as e:
+                    status, payload = 400, {"error": f"bad request: {e}"}
+            else:
+                status, payload = 404, {"error": f"no route for {method} {path}"}
+        except BadRequest as e:
+            status, payload = 400, {"error": f"bad request: {e}"}
+        except Exception as e:
+            print(f"Service error: {e} - {traceback.format_exc()}")
+            status, payload = 500, {"error": str(e)}
+        write_response(writer, status, payload)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+async def serve(host='127.0.0.1', port=8765, socket_path=None):
+    service = CollectionService()
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = await asyncio.start_unix_server(service.handle, path=socket_path)
+        print(f"Serving on unix socket {socket_path}")
+    else:
+        server = await asyncio.start_server(service.handle, host, port)
+        print(f"Serving on http://{host}:{port}")
+    try:
+        with session('service'):  # TRACE_FILE/PROFILE_FILE are written when the server stops
+            async with server:
+                await server.serve_forever()
+    finally:
+        service.close()
+
+async def submit(input_dir, output_dir=None, host='127.0.0.1', port=8765, socket_path=None):
+    with open(os.path.join(input_dir, 'config.json'), 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    payload = {"config": config, "input_dir": os.path.abspath(input_dir)}
+    if output_dir:
+        payload["output_dir"] = os.path.abspath(output_dir)
+    body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    if socket_path:
+        reader, writer = await asyncio.open_unix_connection(socket_path)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+    head = (f"POST /collection HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n")
+    writer.write(head.encode('latin-1') + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b'\r\n\r\n')
+    return int(head.split()[1]), json.loads(body)
+
+def main():
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest='command', required=True)
+    serve_parser = sub.add_parser('serve')
+    submit_parser = sub.add_parser('submit')
+    submit_parser.add_argument('input_dir')
+    submit_parser.add_argument('--output-dir', default=None)
+    for p in (serve_parser, submit_parser):
+        p.add_argument('--host', default='127.0.0.1')
+        p.add_argument('--port', type=int, default=8765)
+        p.add_argument('--socket', default=None, help='use a unix socket instead of TCP')
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        try:
+            asyncio.run(serve(args.host, args.port, args.socket))
+        except KeyboardInterrupt:
+            pass
+    else:
+        start_time = time.time()
+        status, payload = asyncio.run(submit(args.input_dir, args.output_dir, args.host, args.port, args.socket))
+        if status != 200:
+            print(f"Error {status}: {payload.get('error')}")
+            sys.exit(1)
+        print(f"Ranked {len(payload['extracted_sections'])} sections in {time.time() - start_time:.2f} seconds")
+
+if __name__ == '__main__':
+    main()
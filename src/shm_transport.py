@@ -0,0 +1,68 @@
+# src/shm_transport.py
+# Hands NumPy arrays from pool workers to the parent through POSIX shared memory. The worker copies its
+# arrays into one segment and returns only a small handle over the pipe; the parent maps the segment,
+# copies the arrays out and unlinks it. Set SHM_TRANSPORT=0 (or run without /dev/shm) to send arrays inline.
+import os
+import numpy as np
+from multiprocessing import resource_tracker, shared_memory
+
+SHM_TRANSPORT = os.environ.get('SHM_TRANSPORT', '1') != '0'
+
+def export_arrays(arrays):
+    if not SHM_TRANSPORT:
+        return ('inline', arrays)
+    layout = []
+    size = 0
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        layout.append((name, array.dtype.str, array.shape, size))
+        size += array.nbytes
+        size += -size % 8  # Keep every array 8-byte aligned
+    try:
+        shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    except OSError:
+        return ('inline', arrays)
+    for name, dtype, shape, offset in layout:
+        np.ndarray(shape, dtype, buffer=shm.buf, offset=offset)[...] = arrays[name]
+    # The parent owns the segment from here on and unlinks it once read
+    resource_tracker.unregister(shm._name, 'shared_memory')
+    shm.close()
+    return ('shm', shm.name, layout)
+
+def import_arrays(handle):
+    if handle[0] == 'inline':
+        return handle[1]
+    _, name, layout = handle
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        return {field: np.ndarray(shape, dtype, buffer=shm.buf, offset=offset).copy()
+                for field, dtype, shape, offset in layout}
+    finally:
+        shm.close()
+        shm.unlink()
+
+def pack_records(records, text_fields, int_fields):
+    # List of flat dicts -> arrays: every text field in one UTF-8 buffer with offsets, ints as int64 columns
+    encoded = [r[field].encode('utf-8') for r in records for field in text_fields]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    if encoded:
+        offsets[1:] = np.cumsum([len(e) for e in encoded])
+    arrays = {'text': np.frombuffer(b''.join(encoded), dtype=np.uint8), 'offsets': offsets}
+    for field in int_fields:
+        arrays[field] = np.array([r[field] for r in records], dtype=np.int64)
+    return arrays
+
+def unpack_records(arrays, text_fields, int_fields):
+    buf = arrays['text'].tobytes()
+    offsets = arrays['offsets'].tolist()
+    ints = {field: arrays[field].tolist() for field in int_fields}
+    records = []
+    for i in range((len(offsets) - 1) // len(text_fields)):
+        record = {}
+        for j, field in enumerate(text_fields):
+            k = i * len(text_fields) + j
+            record[field] = buf[offsets[k]:offsets[k + 1]].decode('utf-8')
+        for field in int_fields:
+            record[field] = ints[field][i]
+        records.append(record)
+    return records
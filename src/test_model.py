@@ -41,4 +41,16 @@ if not os.path.exists(local_path):
 else:
     print(f"Model already exists at {local_path}")
 
+# Sentence embedding model for subsection_analysis sub-chunks (~90MB)
+embed_model_name = 'sentence-transformers/all-MiniLM-L6-v2'
+embed_local_path = 'models/all-MiniLM-L6-v2'
+
+if not os.path.exists(embed_local_path):
+    from sentence_transformers import SentenceTransformer
+    print(f"Downloading {embed_model_name} to {embed_local_path}...")
+    SentenceTransformer(embed_model_name).save(embed_local_path)
+    print(f"Model saved to {embed_local_path}")
+else:
+    print(f"Model already exists at {embed_local_path}")
+
 # Add blocks for other models (e.g., distilgpt2 from Approach 2) if needed...
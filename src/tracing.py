@@ -0,0 +1,149 @@
+# src/tracing.py
+# Opt-in instrumentation, switched on from the environment so production runs need no code changes:
+#   TRACE_FILE=trace.json    record spans and write a Chrome trace (chrome://tracing, Perfetto) plus a summary
+#   PROFILE_FILE=run.prof    cProfile the run; worker tasks are profiled too and merged into one pstats dump
+# Spans recorded inside pool workers travel back with each task's result and are merged in the parent.
+import cProfile
+import json
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+TRACE_FILE = os.environ.get('TRACE_FILE', '')
+PROFILE_FILE = os.environ.get('PROFILE_FILE', '')
+ENABLED = bool(TRACE_FILE or PROFILE_FILE)
+
+_events = []
+_lock = threading.Lock()
+_profile_stats = []
+
+@contextmanager
+def span(name, **args):
+    if not ENABLED:
+        yield
+        return
+    start = time.perf_counter_ns()
+    try:
+        yield
+    finally:
+        end = time.perf_counter_ns()
+        event = {'name': name, 'ph': 'X', 'ts': start / 1000, 'dur': (end - start) / 1000,
+                 'pid': os.getpid(), 'tid': threading.get_ident()}
+        if args:
+            event['args'] = args
+        with _lock:
+            _events.append(event)
+
+def traced(name):
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return fn(*args, **kwargs)
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def _drain():
+    with _lock:
+        events = list(_events)
+        _events.clear()
+    return events
+
+class _ProfileData:
+    # Lets pstats.Stats load a stats dict that was shipped back from a worker
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+class TracedTask:
+    # Wraps a pool task so the worker returns (result, spans, profile stats) instead of just the result
+    def __init__(self, fn):
+        self.fn = fn
+
+    def __call__(self, arg):
+        _drain()  # Forked workers start with a copy of the parent's buffer
+        profiler = cProfile.Profile() if PROFILE_FILE else None
+        if profiler:
+            profiler.enable()
+        try:
+            result = self.fn(arg)
+        finally:
+            if profiler:
+                profiler.disable()
+        stats = None
+        if profiler:
+            profiler.create_stats()
+            stats = profiler.stats
+        return result, _drain(), stats
+
+def wrap_task(fn):
+    return TracedTask(fn) if ENABLED else fn
+
+def unwrap_result(result):
+    # Inverse of wrap_task for one task result; merges the worker's spans and profile into this process
+    if not ENABLED:
+        return result
+    value, events, stats = result
+    with _lock:
+        _events.extend(events)
+    if stats is not None:
+        _profile_stats.append(stats)
+    return value
+
+def unwrap_results(results):
+    return [unwrap_result(r) for r in results]
+
+def pool_imap_unordered(pool, fn, tasks, name='pool.imap_unordered'):
+    # Submits every task now and returns an iterator over results in completion order
+    results = pool.imap_unordered(wrap_task(fn), tasks)
+    def consume():
+        with span(name, tasks=len(tasks)):
+            for result in results:
+                yield unwrap_result(result)
+    return consume()
+
+def summary(events):
+    totals = {}
+    for event in events:
+        entry = totals.setdefault(event['name'], {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+        entry['count'] += 1
+        entry['total_ms'] += event['dur'] / 1000
+        entry['max_ms'] = max(entry['max_ms'], event['dur'] / 1000)
+    return totals
+
+@contextmanager
+def session(name):
+    # Wraps one top-level run; on exit writes TRACE_FILE and/or PROFILE_FILE
+    if not ENABLED:
+        yield
+        return
+    profiler = cProfile.Profile() if PROFILE_FILE else None
+    if profiler:
+        profiler.enable()
+    try:
+        with span(name):
+            yield
+    finally:
+        if profiler:
+            profiler.disable()
+            stats = pstats.Stats(profiler)
+            for worker_stats in _profile_stats:
+                stats.add(_ProfileData(worker_stats))
+            stats.dump_stats(PROFILE_FILE)
+            _profile_stats.clear()
+            print(f"Profile saved to {PROFILE_FILE}")
+        if TRACE_FILE:
+            events = _drain()
+            totals = summary(events)
+            with open(TRACE_FILE, 'w', encoding='utf-8') as f:
+                json.dump({'traceEvents': events, 'otherData': {'summary': totals}}, f)
+            for span_name, entry in sorted(totals.items(), key=lambda kv: -kv[1]['total_ms']):
+                print(f"{span_name}: {entry['count']} calls, {entry['total_ms']:.1f} ms total, {entry['max_ms']:.1f} ms max")
+            print(f"Trace saved to {TRACE_FILE}")